@@ -1,3 +1,32 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import MatchCacheEntry, Transfer, TrackResult, WorkUnit
+
+
+@admin.register(Transfer)
+class TransferAdmin(admin.ModelAdmin):
+    list_display = ('spotify_playlist_name', 'spotify_user_id', 'status', 'track_count', 'found_count', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('spotify_playlist_id', 'spotify_playlist_name', 'spotify_user_id', 'public_id')
+    # Users' OAuth (refresh) tokens, held while a background transfer runs
+    exclude = ('spotify_token', 'ytmusic_token')
+
+
+@admin.register(TrackResult)
+class TrackResultAdmin(admin.ModelAdmin):
+    list_display = ('transfer', 'position', 'title', 'artist', 'video_id', 'status')
+    list_filter = ('status',)
+    raw_id_fields = ('transfer',)
+
+
+@admin.register(WorkUnit)
+class WorkUnitAdmin(admin.ModelAdmin):
+    list_display = ('transfer', 'kind', 'seq', 'state', 'lease_owner', 'lease_expires_at', 'attempts')
+    list_filter = ('state', 'kind')
+    raw_id_fields = ('transfer',)
+
+
+@admin.register(MatchCacheEntry)
+class MatchCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key_hash', 'video_id', 'strategy', 'updated_at')
+    search_fields = ('video_id',)
@@ -0,0 +1,277 @@
+import collections
+import functools
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Transfer, WorkUnit
+
+
+# Admission control for POST /transfer/. A transfer is only started if the
+# work already in flight leaves room for it; otherwise the client gets a
+# fast 429 (this user has too much running) or 503 (the service or a
+# provider quota is saturated) with Retry-After, rather than a request
+# that queues behind everyone else until it times out. The signals are:
+#
+#   in-flight tracks   tracks of synchronous transfers admitted by this
+#                      process that haven't finished yet
+#   background backlog tracks still to be fetched/searched by background
+#                      work units, across all worker nodes
+#   provider quota     calls made to each provider by this process in the
+#                      last minute, against a configured per-minute budget
+#
+# The new transfer's size comes from a cheap `tracks.total` lookup.
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, message, status, retry_after):
+        self.reason = reason
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(message)
+
+
+class ProviderQuota:
+    """Calls made to one provider in the last `window_seconds`, against `limit` (0 = unlimited)."""
+
+    def __init__(self, provider, limit=0, window_seconds=60.0, clock=time.monotonic):
+        self.provider = provider
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._calls = collections.deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0] >= self.window_seconds:
+            self._calls.popleft()
+
+    def record(self):
+        with self._lock:
+            now = self._clock()
+            self._calls.append(now)
+            self._trim(now)
+
+    def used(self):
+        with self._lock:
+            self._trim(self._clock())
+            return len(self._calls)
+
+    def remaining(self):
+        if not self.limit:
+            return None
+        return max(0, self.limit - self.used())
+
+    def seconds_until_available(self, calls):
+        """Seconds until `calls` more calls fit in the window (capped at the limit)."""
+        if not self.limit:
+            return 0.0
+        calls = min(calls, self.limit)
+        with self._lock:
+            now = self._clock()
+            self._trim(now)
+            excess = len(self._calls) + calls - self.limit
+            if excess <= 0:
+                return 0.0
+            return self._calls[excess - 1] + self.window_seconds - now
+
+    def stats(self):
+        used = self.used()
+        return {
+            'limit_per_minute': self.limit or None,
+            'used_last_minute': used,
+            'remaining': max(0, self.limit - used) if self.limit else None,
+        }
+
+
+_quotas = {}
+_quotas_lock = threading.Lock()
+
+
+def get_quota(provider):
+    """Process-wide call quota for a provider ('spotify' or 'ytmusic')."""
+    quota = _quotas.get(provider)
+    if quota is None:
+        with _quotas_lock:
+            quota = _quotas.get(provider)
+            if quota is None:
+                limits = {
+                    'spotify': settings.PROVIDER_QUOTA_SPOTIFY_CALLS_PER_MINUTE,
+                    'ytmusic': settings.PROVIDER_QUOTA_YTMUSIC_CALLS_PER_MINUTE,
+                }
+                quota = _quotas[provider] = ProviderQuota(provider, limits.get(provider, 0))
+    return quota
+
+
+def record_provider_call(provider):
+    get_quota(provider).record()
+
+
+class Ticket:
+    """An admitted transfer's share of the in-flight tracks; release() when it's done."""
+
+    def __init__(self, controller, user_id, tracks):
+        self._controller = controller
+        self.user_id = user_id
+        self.tracks = tracks
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+
+class AdmissionController:
+    BACKLOG_CACHE_SECONDS = 2.0
+
+    def __init__(self, max_inflight_tracks, max_background_tracks, max_per_user, retry_after):
+        self.max_inflight_tracks = max_inflight_tracks
+        self.max_background_tracks = max_background_tracks
+        self.max_per_user = max_per_user
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._inflight_tracks = 0
+        self._inflight_by_user = collections.Counter()
+        self._backlog = (0.0, None)  # (checked_at, tracks)
+        self.admitted = 0
+        self.rejected = collections.Counter()
+
+    def background_backlog(self):
+        """Tracks background units still have to fetch and search; cached for a couple of seconds."""
+        checked_at, tracks = self._backlog
+        if tracks is not None and time.monotonic() - checked_at < self.BACKLOG_CACHE_SECONDS:
+            return tracks
+        from .jobs import PAGE_SIZE, SEARCH_BATCH_SIZE  # jobs -> providers -> this module
+
+        units = dict(
+            WorkUnit.objects.filter(
+                state__in=[WorkUnit.STATE_PENDING, WorkUnit.STATE_LEASED],
+                kind__in=[WorkUnit.KIND_FETCH_PAGE, WorkUnit.KIND_SEARCH_BATCH],
+            ).values_list('kind').annotate(n=Count('id'))
+        )
+        tracks = (units.get(WorkUnit.KIND_FETCH_PAGE, 0) * PAGE_SIZE
+                  + units.get(WorkUnit.KIND_SEARCH_BATCH, 0) * SEARCH_BATCH_SIZE)
+        self._backlog = (time.monotonic(), tracks)
+        return tracks
+
+    def _reject(self, reason, message, status, retry_after=None):
+        with self._lock:
+            self.rejected[reason] += 1
+        print(f"DEBUG: Transfer rejected ({reason}): {message}")
+        raise AdmissionRejected(reason, message, status, retry_after or self.retry_after)
+
+    def precheck(self, background=False):
+        """Checks that need no provider call; run before validating tokens."""
+        if not background and self.max_inflight_tracks and self._inflight_tracks >= self.max_inflight_tracks:
+            self._reject('inflight_tracks', 'Too many transfers are running right now.', 503)
+        spotify = get_quota('spotify')
+        if spotify.remaining() == 0:
+            self._reject('spotify_quota', 'The Spotify request quota is used up for now.', 503,
+                         spotify.seconds_until_available(1))
+
+    def admit(self, user_id, tracks, background=False):
+        """Admit a transfer of about `tracks` tracks or raise AdmissionRejected.
+
+        Synchronous transfers hold their tracks in flight until the returned
+        Ticket is released; a background transfer's work is accounted for by
+        its work units once queued.
+        """
+        if background:
+            if self.max_background_tracks and self.background_backlog() + tracks > self.max_background_tracks:
+                self._reject('background_backlog', 'The background transfer queue is full.', 503)
+        else:
+            ytmusic = get_quota('ytmusic')
+            # One search per track plus creating and filling the playlist
+            needed = tracks + 2
+            remaining = ytmusic.remaining()
+            if remaining is not None and remaining < min(needed, ytmusic.limit):
+                self._reject('ytmusic_quota', 'The YouTube Music request quota is used up for now.', 503,
+                             ytmusic.seconds_until_available(needed))
+
+        running_in_background = self._running_in_background(user_id) if self.max_per_user else 0
+        ticket = Ticket(self, user_id, 0 if background else tracks)
+        # Check and reserve in one step so a burst of requests can't all get in
+        with self._lock:
+            if self.max_per_user and self._inflight_by_user[user_id] + running_in_background >= self.max_per_user:
+                reason = 'per_user'
+            elif (ticket.tracks and self.max_inflight_tracks and self._inflight_tracks
+                  and self._inflight_tracks + ticket.tracks > self.max_inflight_tracks):
+                # A transfer larger than the limit still gets in when nothing else runs
+                reason = 'inflight_tracks'
+            else:
+                reason = None
+                self.admitted += 1
+                self._inflight_tracks += ticket.tracks
+                self._inflight_by_user[user_id] += 1
+        if reason == 'per_user':
+            self._reject(reason, f'You already have {self.max_per_user} transfers running. '
+                                 f'Please wait for one to finish.', 429)
+        if reason == 'inflight_tracks':
+            self._reject(reason, 'Too many transfers are running right now.', 503)
+        return ticket
+
+    def _running_in_background(self, user_id):
+        return Transfer.objects.filter(
+            spotify_user_id=user_id, status=Transfer.STATUS_RUNNING,
+            work_units__state__in=[WorkUnit.STATE_PENDING, WorkUnit.STATE_LEASED],
+        ).values('pk').distinct().count()
+
+    def _release(self, ticket):
+        with self._lock:
+            self._inflight_tracks -= ticket.tracks
+            self._inflight_by_user[ticket.user_id] -= 1
+            if self._inflight_by_user[ticket.user_id] <= 0:
+                del self._inflight_by_user[ticket.user_id]
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'limits': {
+                    'max_inflight_tracks': self.max_inflight_tracks or None,
+                    'max_background_tracks': self.max_background_tracks or None,
+                    'max_transfers_per_user': self.max_per_user or None,
+                },
+                'inflight_tracks': self._inflight_tracks,
+                'inflight_transfers': sum(self._inflight_by_user.values()),
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+            }
+        stats['background_backlog_tracks'] = self.background_backlog()
+        stats['provider_quotas'] = {provider: get_quota(provider).stats() for provider in ('spotify', 'ytmusic')}
+        return stats
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission():
+    """Process-wide admission controller, configured from settings."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController(
+                    max_inflight_tracks=settings.TRANSFER_ADMISSION_MAX_INFLIGHT_TRACKS,
+                    max_background_tracks=settings.TRANSFER_ADMISSION_MAX_BACKGROUND_TRACKS,
+                    max_per_user=settings.TRANSFER_ADMISSION_MAX_PER_USER,
+                    retry_after=settings.TRANSFER_ADMISSION_RETRY_AFTER,
+                )
+    return _controller
+
+
+def releases_admission(view):
+    """Release the Ticket a view stored on `request.admission_ticket` once it returns."""
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            ticket = getattr(request, 'admission_ticket', None)
+            if ticket is not None:
+                ticket.release()
+    return wrapped
@@ -0,0 +1,203 @@
+import collections
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+from .deadlines import DeadlineExceeded
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open.
+
+    This is always retryable: `retry_after` is the number of seconds until
+    the breaker will let a probe call through again.
+    """
+
+    retryable = True
+
+    def __init__(self, provider, retry_after):
+        self.provider = provider
+        self.retry_after = max(0.0, retry_after)
+        super().__init__(f"{provider} is temporarily unavailable, retry in {self.retry_after:.0f}s")
+
+
+# ytmusicapi reports HTTP errors as YTMusicServerError with the status only
+# in the message
+_YTMUSIC_HTTP_STATUS = re.compile(r"Server returned HTTP (\d{3})")
+
+
+def _http_status(exc, ytmusic_errors):
+    status = getattr(exc, 'http_status', None)
+    if status is None:
+        status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if status is None and ytmusic_errors is not None and isinstance(exc, ytmusic_errors.YTMusicServerError):
+        match = _YTMUSIC_HTTP_STATUS.match(str(exc))
+        if match:
+            status = int(match.group(1))
+    return status
+
+
+def _is_failure(exc):
+    # Running out of transfer time says nothing about the provider
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    # ytmusicapi's exceptions, if it has been imported yet (it is loaded lazily)
+    ytmusic_errors = sys.modules.get('ytmusicapi.exceptions')
+    # Raised for invalid use of the library (bad auth file, unsupported language...)
+    if ytmusic_errors is not None and isinstance(exc, ytmusic_errors.YTMusicUserError):
+        return False
+    # A 4xx (other than rate limiting) means our request was bad, e.g. a
+    # private or missing playlist or an expired user token; the provider
+    # itself is healthy.
+    status = _http_status(exc, ytmusic_errors)
+    if status is not None and 400 <= status < 500 and status != 429:
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one provider.
+
+    While closed, outcomes of the last `window_seconds` are tracked; once at
+    least `min_calls` were made and the share of failures reaches
+    `failure_rate`, the circuit opens. A call slower than
+    `slow_call_seconds` counts as a failure even if it succeeded. An open
+    circuit rejects calls with CircuitOpenError for `open_seconds`, then goes
+    half-open and lets `half_open_calls` probe calls through: if they all
+    succeed it closes again, any failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, slow_call_seconds=10.0, min_calls=10,
+                 window_seconds=30.0, open_seconds=30.0, half_open_calls=1, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._outcomes = collections.deque()  # (timestamp, failed)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open(self._clock())
+            return self._state
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self._opened_at + self.open_seconds - self._clock())
+
+    def _maybe_half_open(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+    def _open(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    def before_call(self):
+        """Reserve permission for one call or raise CircuitOpenError."""
+        with self._lock:
+            now = self._clock()
+            self._maybe_half_open(now)
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and self._probes_in_flight < self.half_open_calls:
+                self._probes_in_flight += 1
+                return
+            self.rejected_calls += 1
+            retry_after = self._opened_at + self.open_seconds - now if self._state == self.OPEN else 1.0
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record(self, failed, elapsed):
+        """Record the outcome of a call admitted by before_call()."""
+        failed = failed or elapsed >= self.slow_call_seconds
+        with self._lock:
+            now = self._clock()
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed:
+                    self._open(now)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._state = self.CLOSED
+                return
+            if self._state != self.CLOSED:
+                return
+            self._outcomes.append((now, failed))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+            if len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, f in self._outcomes if f)
+                if failures >= self.failure_rate * len(self._outcomes):
+                    self._open(now)
+
+    def call(self, fn, *args, **kwargs):
+        self.before_call()
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(_is_failure(e), time.monotonic() - start)
+            raise
+        self.record(False, time.monotonic() - start)
+        return result
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'recent_calls': len(self._outcomes),
+                'recent_failures': sum(1 for _, f in self._outcomes if f),
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected_calls,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """Process-wide breaker for a provider ('spotify' or 'ytmusic')."""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(provider)
+            if breaker is None:
+                breaker = _breakers[provider] = CircuitBreaker(
+                    provider,
+                    failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+                    slow_call_seconds=settings.CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+                    min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+                    window_seconds=settings.CIRCUIT_BREAKER_WINDOW_SECONDS,
+                    open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+                )
+    return breaker
+
+
+def all_breakers():
+    with _breakers_lock:
+        return dict(_breakers)
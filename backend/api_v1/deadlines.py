@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+import contextvars
+import functools
+import time
+
+from django.conf import settings
+
+
+# The deadline of the transfer being worked on. providers.DeadlineSession
+# reads it to cap the timeout of every Spotify / YouTube Music request, and
+# providers.GuardedClient refuses to start a call once it has passed. The
+# scheduler and the hedger run tasks in a copy of the submitting context, so
+# searches on worker threads see the same deadline.
+_deadline = contextvars.ContextVar('transfer_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The transfer ran out of time; whatever was done so far is kept."""
+
+
+class Deadline:
+    def __init__(self, seconds, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self):
+        return self.expires_at - self._clock()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded("transfer deadline exceeded")
+
+
+@contextmanager
+def deadline(seconds):
+    """Run the block with a deadline `seconds` from now, or the enclosing one if that is sooner.
+
+    seconds=None keeps the enclosing deadline (if any) unchanged.
+    """
+    outer = _deadline.get()
+    if seconds is None:
+        yield outer
+        return
+    inner = Deadline(seconds)
+    if outer is not None and outer.expires_at < inner.expires_at:
+        inner = outer
+    token = _deadline.set(inner)
+    try:
+        yield inner
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+def check_deadline():
+    current = _deadline.get()
+    if current is not None:
+        current.check()
+
+
+def call_timeout(default):
+    """Timeout for one outbound call: `default`, or less if the deadline is nearer.
+
+    Returns (timeout, limited), `limited` being True when the deadline set
+    it. Raises DeadlineExceeded if the deadline has already passed.
+    """
+    current = _deadline.get()
+    if current is None:
+        return default, False
+    remaining = current.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded("transfer deadline exceeded")
+    if default is None or remaining < default:
+        return remaining, True
+    return default, False
+
+
+def within_deadline(setting):
+    """Decorator running a view under a deadline of settings.<setting> seconds (0 = none)."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            with deadline(getattr(settings, setting) or None):
+                return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def search_budget():
+    """Seconds of the current deadline that may go to searching, keeping
+    TRANSFER_DEADLINE_WRITE_RESERVE_SECONDS (at most half of what's left)
+    for writing the playlist; None without a deadline."""
+    current = _deadline.get()
+    if current is None:
+        return None
+    remaining = current.remaining()
+    return max(remaining - settings.TRANSFER_DEADLINE_WRITE_RESERVE_SECONDS, remaining / 2)
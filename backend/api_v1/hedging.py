@@ -0,0 +1,157 @@
+import collections
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+
+
+class LatencyWindow:
+    """Latencies of the last `size` successful calls, with cached percentiles."""
+
+    def __init__(self, size=500, refresh_every=20):
+        self._samples = collections.deque(maxlen=size)
+        self._refresh_every = refresh_every
+        self._since_refresh = 0
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_refresh += 1
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct):
+        with self._lock:
+            if self._since_refresh >= self._refresh_every or len(self._sorted) != len(self._samples):
+                self._sorted = sorted(self._samples)
+                self._since_refresh = 0
+            if not self._sorted:
+                return None
+            index = min(len(self._sorted) - 1, int(pct / 100.0 * len(self._sorted)))
+            return self._sorted[index]
+
+
+class Hedger:
+    """Issues a duplicate of a slow call and takes whichever answers first.
+
+    A call that hasn't returned after the `percentile`-th percentile of
+    recent latencies (but at least `min_delay` seconds) gets a second,
+    identical call; the first successful response wins. Hedges are paid
+    for from a budget that grows by `budget_ratio` per call, so they never
+    exceed that share of traffic even when everything is slow. Until
+    `min_samples` latencies are known no hedging happens. The losing call
+    can't be cancelled mid-request; its response is just dropped.
+    """
+
+    def __init__(self, percentile=95.0, budget_ratio=0.05, min_delay=0.05, min_samples=20, max_workers=16):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyWindow()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedged-call')
+        self._lock = threading.Lock()
+        self._budget = 1.0
+        self.calls = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+        self.hedges_skipped_budget = 0
+
+    def _submit(self, fn, args, kwargs):
+        started = time.monotonic()
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, fn, *args, **kwargs)
+
+        def record(f):
+            if not f.cancelled() and f.exception() is None:
+                self.latencies.add(time.monotonic() - started)
+        future.add_done_callback(record)
+        return future
+
+    def hedge_delay(self):
+        if len(self.latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    def _take_budget(self):
+        with self._lock:
+            if self._budget >= 1.0:
+                self._budget -= 1.0
+                self.hedges_issued += 1
+                return True
+            self.hedges_skipped_budget += 1
+            return False
+
+    def call(self, fn, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            # Unused budget carries over (up to a burst of 100 calls' worth) so a
+            # cluster of slow calls can still be hedged
+            self._budget = min(self._budget + self.budget_ratio, max(1.0, 100 * self.budget_ratio))
+        delay = self.hedge_delay()
+        primary = self._submit(fn, args, kwargs)
+        if delay is None:
+            return primary.result()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            return primary.result()
+
+        hedge = self._submit(fn, args, kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedges_won += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self):
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedges_issued': self.hedges_issued,
+                'hedges_won': self.hedges_won,
+                'hedges_skipped_budget': self.hedges_skipped_budget,
+                'hedge_rate': round(self.hedges_issued / self.calls, 4) if self.calls else 0.0,
+                'hedge_win_rate': round(self.hedges_won / self.hedges_issued, 4) if self.hedges_issued else 0.0,
+                'current_hedge_delay_seconds': round(delay, 4) if delay is not None else None,
+                'latency_p50_seconds': self.latencies.percentile(50),
+                'latency_p95_seconds': self.latencies.percentile(95),
+                'latency_p99_seconds': self.latencies.percentile(99),
+            }
+
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger():
+    """Process-wide hedger for YouTube Music searches, configured from settings."""
+    global _hedger
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = Hedger(
+                    percentile=settings.SEARCH_HEDGE_PERCENTILE,
+                    budget_ratio=settings.SEARCH_HEDGE_BUDGET,
+                    min_delay=settings.SEARCH_HEDGE_MIN_DELAY,
+                    min_samples=settings.SEARCH_HEDGE_MIN_SAMPLES,
+                    # Each scheduler worker may have a primary and a hedge in flight
+                    max_workers=2 * settings.TRANSFER_SEARCH_WORKERS,
+                )
+    return _hedger
+
+
+def hedging_stats():
+    return _hedger.stats() if _hedger is not None else None
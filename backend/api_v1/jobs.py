@@ -0,0 +1,490 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import providers
+from .breakers import CircuitOpenError, get_breaker
+from .deadlines import DeadlineExceeded, check_deadline, current_deadline, deadline
+from .matching import CACHED_STRATEGIES, cached_matches, store_matches
+from .models import Transfer, TrackResult, WorkUnit
+from .persistence import TrackResultWriter
+from .scheduler import get_scheduler
+from .transfers import (
+    add_to_playlist, completed_future, hydrate_songs, playlist_video_ids, search_song, song_from_track,
+    stored_primary_artist,
+)
+
+
+# Background transfers are split into work units stored in the database:
+#
+#   fetch_page       one page of playlist tracks -> pending TrackResult rows,
+#                    plus a search_batch unit per SEARCH_BATCH_SIZE of them
+#   search_batch     resolves its pending rows on YouTube Music
+#   create_playlist  once every fetch/search unit is done
+#   write_batch      adds the next WRITE_BATCH_SIZE matches, in playlist
+#                    order, then enqueues the following write_batch
+#
+# Any worker process on any node can claim any unit (see claim() and
+# Lease), so capacity scales with the number of workers and a unit held by
+# a node that died is picked up again once its lease expires.
+#
+# fetch_page and search_batch units run under the transfer's deadline
+# (TRANSFER_BACKGROUND_DEADLINE_SECONDS after it was created). Once it has
+# passed, the fetch/search work that is left is skipped and the transfer
+# goes on to write what it matched, finishing as "partial".
+
+PAGE_SIZE = 100  # Spotify's maximum for playlist items
+SEARCH_BATCH_SIZE = 50
+WRITE_BATCH_SIZE = 100
+CLAIM_CANDIDATES = 10
+
+_SEARCH_KINDS = (WorkUnit.KIND_FETCH_PAGE, WorkUnit.KIND_SEARCH_BATCH)
+
+
+class LeaseLost(Exception):
+    """The unit's lease expired and another worker may have claimed it."""
+
+
+def _unit(transfer, kind, seq=0, payload=None, delay=0.0):
+    return WorkUnit(
+        transfer=transfer,
+        kind=kind,
+        seq=seq,
+        payload=payload or {},
+        available_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def enqueue(units):
+    """Insert work units, ignoring ones that already exist (same transfer, kind and seq)."""
+    WorkUnit.objects.bulk_create(units, ignore_conflicts=True)
+
+
+def start_background_transfer(transfer, track_total):
+    """Queue the fetch_page units for a newly created background transfer."""
+    enqueue([
+        _unit(transfer, WorkUnit.KIND_FETCH_PAGE, seq=offset // PAGE_SIZE, payload={'offset': offset})
+        for offset in range(0, max(track_total, 1), PAGE_SIZE)
+    ])
+
+
+def claim(worker_id, lease_seconds=None):
+    """Lease the next available unit for `worker_id`, or return None.
+
+    Transfers take turns: each transfer's next unit comes before any
+    transfer's second one, and among those the transfer that was served
+    least recently (by its units' last heartbeat) goes first, so a big
+    library queued earlier doesn't hold up everyone else's transfers.
+
+    The lease is taken with a conditional UPDATE, so when several workers go
+    for the same unit exactly one of them wins; this only relies on row
+    atomicity and works the same on SQLite and Postgres.
+    """
+    lease_seconds = lease_seconds or settings.TRANSFER_JOB_LEASE_SECONDS
+    now = timezone.now()
+    claimable = (
+        Q(state=WorkUnit.STATE_PENDING, available_at__lte=now)
+        | Q(state=WorkUnit.STATE_LEASED, lease_expires_at__lt=now)
+    )
+    last_served = (
+        WorkUnit.objects.filter(transfer=OuterRef('transfer')).values('transfer')
+        .annotate(last=Max('heartbeat_at')).values('last')
+    )
+    candidates = list(
+        WorkUnit.objects.filter(claimable)
+        .annotate(
+            turn=Window(RowNumber(), partition_by=[F('transfer')], order_by=[F('available_at').asc(), F('id').asc()]),
+            last_served=Subquery(last_served),
+        )
+        .order_by('turn', F('last_served').asc(nulls_first=True), 'available_at', 'id')
+        .values_list('pk', flat=True)[:CLAIM_CANDIDATES]
+    )
+    for pk in candidates:
+        claimed = WorkUnit.objects.filter(claimable, pk=pk).update(
+            state=WorkUnit.STATE_LEASED,
+            lease_owner=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return WorkUnit.objects.select_related('transfer').get(pk=pk)
+    return None
+
+
+class Lease:
+    """A worker's claim on a unit, kept alive by a heartbeat thread."""
+
+    def __init__(self, unit, worker_id, lease_seconds=None):
+        self.unit = unit
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds or settings.TRANSFER_JOB_LEASE_SECONDS
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _owned(self):
+        return WorkUnit.objects.filter(pk=self.unit.pk, lease_owner=self.worker_id, state=WorkUnit.STATE_LEASED)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._heartbeat, name=f'lease-{self.unit.pk}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _heartbeat(self):
+        try:
+            while not self._stop.wait(self.lease_seconds / 3.0):
+                now = timezone.now()
+                if not self._owned().update(lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                                            heartbeat_at=now):
+                    self.lost = True
+                    return
+        finally:
+            connection.close()
+
+    def check(self):
+        if self.lost:
+            raise LeaseLost(str(self.unit))
+
+    def complete(self):
+        """Mark the unit done; call inside the transaction that saves its output."""
+        self.check()
+        if not self._owned().update(state=WorkUnit.STATE_DONE, lease_owner='', lease_expires_at=None,
+                                    updated_at=timezone.now()):
+            raise LeaseLost(str(self.unit))
+
+    def release(self, delay, error='', count_attempt=True):
+        """Give the unit back to the queue, to be retried after `delay` seconds."""
+        now = timezone.now()
+        self._owned().update(
+            state=WorkUnit.STATE_PENDING,
+            lease_owner='',
+            lease_expires_at=None,
+            available_at=now + timedelta(seconds=delay),
+            attempts=F('attempts') if count_attempt else F('attempts') - 1,
+            last_error=error[:2000],
+            updated_at=now,
+        )
+
+    def fail(self, error):
+        self._owned().update(state=WorkUnit.STATE_FAILED, lease_owner='', lease_expires_at=None,
+                             last_error=error[:2000], updated_at=timezone.now())
+
+
+# --- Provider clients for background work ---
+
+def _spotify_for(transfer):
+    token = transfer.spotify_token or {}
+    expires_at = token.get('expires_at')
+    if token.get('refresh_token') and expires_at and expires_at - 60 < time.time():
+        # Background transfers can outlive the hour a Spotify token is valid for
+        token = providers.spotify_oauth(settings.SPOTIPY_REDIRECT_URI).refresh_access_token(token['refresh_token'])
+        transfer.spotify_token = token
+        Transfer.objects.filter(pk=transfer.pk).update(spotify_token=token)
+    return providers.spotify_client(token['access_token'])
+
+
+class _YTMusicFor:
+    def __init__(self, transfer):
+        self.transfer = transfer
+
+    def __enter__(self):
+        self.client, self.temp_token_file = providers.ytmusic_client(self.transfer.ytmusic_token)
+        return self.client
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            os.unlink(self.temp_token_file)
+        except OSError:
+            pass
+
+
+# --- Unit handlers ---
+
+def _fetch_page(unit, lease):
+    transfer = unit.transfer
+    offset = unit.payload['offset']
+    sp = _spotify_for(transfer)
+    page = sp.playlist_items(
+        transfer.spotify_playlist_id, offset=offset, limit=PAGE_SIZE,
+        fields='total,items(track(id,name,artists(name)))',
+    )
+    items = page.get('items') or []
+    results = []
+    for index, item in enumerate(items):
+        song = song_from_track(item.get('track'))
+        if song:
+            results.append(TrackResult(
+                transfer=transfer, position=offset + index, spotify_id=song['spotify_id'],
+                title=song['title'][:255], artist=song['artist'][:255],
+                primary_artist=stored_primary_artist(song), status=TrackResult.STATUS_PENDING,
+            ))
+    lease.check()
+    with transaction.atomic():
+        TrackResult.objects.bulk_create(results, ignore_conflicts=True)
+        enqueue([
+            _unit(transfer, WorkUnit.KIND_SEARCH_BATCH, seq=start,
+                  payload={'start': start, 'end': start + SEARCH_BATCH_SIZE})
+            for start in range(offset, offset + len(items), SEARCH_BATCH_SIZE)
+        ])
+        lease.complete()
+    _maybe_start_writing(transfer)
+
+
+def _search_batch(unit, lease):
+    transfer = unit.transfer
+    pending = list(TrackResult.objects.filter(
+        transfer=transfer, status=TrackResult.STATUS_PENDING,
+        position__gte=unit.payload['start'], position__lt=unit.payload['end'],
+    ).order_by('position'))
+    songs = [{'spotify_id': result.spotify_id, 'title': result.title, 'artist': result.artist,
+              'primary_artist': result.primary_artist} for result in pending]
+    cache_hits = cached_matches(songs)
+    try:
+        # Durations help pick the right version of a song; with
+        # SEARCH_BATCH_SIZE tracks per batch this is a single call
+        hydrate_songs(_spotify_for(transfer), [song for i, song in enumerate(songs) if i not in cache_hits])
+    except Exception as e:
+        print(f"DEBUG: Could not load track details for transfer {transfer.public_id}, matching without them: {e}")
+    new_matches = []
+    paused_by = None
+    # Search errors are only written once we know the provider wasn't
+    # degraded; if the unit pauses they're searched again when it's retried
+    failed = []
+    with _YTMusicFor(transfer) as ytmusic, TrackResultWriter(transfer) as writer:
+        job = get_scheduler().job(transfer.spotify_user_id, size=transfer.track_count)
+        searches = [
+            completed_future((cache_hits[i], 'cache', None)) if i in cache_hits else job.submit(search_song, ytmusic, song)
+            for i, song in enumerate(songs)
+        ]
+        for result, song, search in zip(pending, songs, searches):
+            if paused_by is not None:
+                search.cancel()
+                continue
+            try:
+                current = current_deadline()
+                video_id, strategy, score = search.result(timeout=max(0, current.remaining()) if current else None)
+            except CircuitOpenError as e:
+                # Leave the rest pending; the unit is retried once the provider recovers
+                paused_by = e
+                continue
+            except (DeadlineExceeded, FutureTimeoutError):
+                # Keep what was found so far, leave the rest pending
+                paused_by = DeadlineExceeded("transfer deadline exceeded")
+                search.cancel()
+                continue
+            except Exception as e:
+                breaker = get_breaker('ytmusic')
+                if breaker.state != breaker.CLOSED:
+                    # YouTube Music is degraded: leave the rest pending rather
+                    # than recording failures that say nothing about the songs
+                    paused_by = CircuitOpenError('ytmusic', breaker.retry_after())
+                    print(f"DEBUG: Pausing {unit}: {paused_by}")
+                    continue
+                print(f"ERROR: Failed to search for song {result.title}: {e}")
+                failed.append(result)
+                continue
+            if video_id:
+                result.status, result.video_id, result.strategy = TrackResult.STATUS_MATCHED, video_id, strategy
+                result.score = score
+                writer.update(result, ['status', 'video_id', 'strategy', 'score'])
+                if strategy in CACHED_STRATEGIES:
+                    new_matches.append((song, video_id, strategy))
+            else:
+                result.status = TrackResult.STATUS_NOT_FOUND
+                writer.update(result, ['status'])
+        if paused_by is None:
+            for result in failed:
+                result.status = TrackResult.STATUS_FAILED
+                writer.update(result, ['status'])
+        lease.check()
+        with transaction.atomic():
+            writer.flush()
+            store_matches(new_matches)
+            if paused_by is None:
+                lease.complete()
+    if paused_by is not None:
+        raise paused_by
+    _maybe_start_writing(transfer)
+
+
+def _maybe_start_writing(transfer):
+    # Whoever finishes the last fetch/search unit queues playlist creation;
+    # if two workers get here at once the unique (transfer, kind, seq) key
+    # keeps only one of the units.
+    unfinished = WorkUnit.objects.filter(transfer=transfer, kind__in=_SEARCH_KINDS).exclude(state=WorkUnit.STATE_DONE)
+    if not unfinished.exists():
+        enqueue([_unit(transfer, WorkUnit.KIND_CREATE_PLAYLIST)])
+
+
+def _create_playlist(unit, lease):
+    transfer = unit.transfer
+    if not transfer.track_results.filter(status=TrackResult.STATUS_MATCHED).exists():
+        with transaction.atomic():
+            lease.complete()
+            _finalize(transfer, Transfer.STATUS_FAILED)
+        return
+    if not transfer.yt_playlist_id:
+        with _YTMusicFor(transfer) as ytmusic:
+            playlist_id = ytmusic.create_playlist(
+                title=transfer.yt_playlist_name,
+                description=f"Transferred from Spotify playlist '{transfer.spotify_playlist_name}'",
+                privacy_status="PRIVATE"
+            )
+        # Saved straight away so a retry never creates a second playlist
+        transfer.yt_playlist_id = playlist_id
+        Transfer.objects.filter(pk=transfer.pk).update(yt_playlist_id=playlist_id)
+    with transaction.atomic():
+        enqueue([_unit(transfer, WorkUnit.KIND_WRITE_BATCH, seq=0)])
+        lease.complete()
+
+
+def _write_batch(unit, lease):
+    transfer = unit.transfer
+    batch = list(transfer.track_results.filter(status=TrackResult.STATUS_MATCHED).order_by('position')[:WRITE_BATCH_SIZE])
+    if batch:
+        # YouTube Music rejects a whole add that contains a video the playlist
+        # already has, so each video is only added once; rows for a repeated
+        # video are marked added along with the first
+        present = set(transfer.track_results.filter(
+            status=TrackResult.STATUS_ADDED, video_id__in={result.video_id for result in batch},
+        ).values_list('video_id', flat=True))
+        with _YTMusicFor(transfer) as ytmusic:
+            if unit.attempts > 1:
+                # An earlier attempt may have added the batch and then died
+                # before recording it
+                present |= playlist_video_ids(ytmusic, transfer.yt_playlist_id)
+            video_ids = list(dict.fromkeys(result.video_id for result in batch if result.video_id not in present))
+            if video_ids:
+                add_to_playlist(ytmusic, transfer.yt_playlist_id, video_ids)
+    lease.check()
+    with transaction.atomic():
+        if batch:
+            TrackResult.objects.filter(pk__in=[result.pk for result in batch]).update(status=TrackResult.STATUS_ADDED)
+            enqueue([_unit(transfer, WorkUnit.KIND_WRITE_BATCH, seq=unit.seq + 1)])
+        lease.complete()
+        if not batch:
+            _finalize(transfer, Transfer.STATUS_COMPLETED)
+
+
+def _expire(unit, lease):
+    """The transfer is past its deadline: skip its remaining fetch/search
+    units and move on to writing the tracks matched so far."""
+    transfer = unit.transfer
+    print(f"DEBUG: Transfer {transfer.public_id} is past its deadline, skipping its remaining searches")
+    try:
+        with transaction.atomic():
+            lease.complete()
+            WorkUnit.objects.filter(transfer=transfer, kind__in=_SEARCH_KINDS, state=WorkUnit.STATE_PENDING).update(
+                state=WorkUnit.STATE_DONE, last_error='Skipped: transfer deadline exceeded', updated_at=timezone.now())
+    except LeaseLost:
+        print(f"DEBUG: Lost lease on {unit}, leaving it to its new owner")
+        return
+    _maybe_start_writing(transfer)
+
+
+def _time_left(transfer):
+    """Seconds until the transfer's deadline, or None if background transfers have none."""
+    if not settings.TRANSFER_BACKGROUND_DEADLINE_SECONDS:
+        return None
+    elapsed = (timezone.now() - transfer.created_at).total_seconds()
+    return settings.TRANSFER_BACKGROUND_DEADLINE_SECONDS - elapsed
+
+
+def _finalize(transfer, status):
+    counts = dict(transfer.track_results.values_list('status').annotate(n=Count('id')))
+    if status == Transfer.STATUS_COMPLETED and (
+            counts.get(TrackResult.STATUS_PENDING) or sum(counts.values()) < transfer.track_count):
+        # Cut off by the deadline before every track was fetched and searched
+        status = Transfer.STATUS_PARTIAL
+    transfer.status = status
+    transfer.found_count = counts.get(TrackResult.STATUS_ADDED, 0) + counts.get(TrackResult.STATUS_MATCHED, 0)
+    transfer.not_found_count = counts.get(TrackResult.STATUS_NOT_FOUND, 0) + counts.get(TrackResult.STATUS_FAILED, 0)
+    transfer.spotify_token = None
+    transfer.ytmusic_token = None
+    transfer.save(update_fields=['status', 'found_count', 'not_found_count', 'spotify_token', 'ytmusic_token',
+                                 'updated_at'])
+
+
+HANDLERS = {
+    WorkUnit.KIND_FETCH_PAGE: _fetch_page,
+    WorkUnit.KIND_SEARCH_BATCH: _search_batch,
+    WorkUnit.KIND_CREATE_PLAYLIST: _create_playlist,
+    WorkUnit.KIND_WRITE_BATCH: _write_batch,
+}
+
+
+def process(unit, worker_id, lease_seconds=None):
+    """Run one claimed unit, releasing or failing it if the handler raises."""
+    lease = Lease(unit, worker_id, lease_seconds).start()
+    try:
+        if unit.kind in _SEARCH_KINDS:
+            with deadline(_time_left(unit.transfer)):
+                check_deadline()
+                HANDLERS[unit.kind](unit, lease)
+        else:
+            HANDLERS[unit.kind](unit, lease)
+    except DeadlineExceeded:
+        _expire(unit, lease)
+    except LeaseLost:
+        print(f"DEBUG: Lost lease on {unit}, leaving it to its new owner")
+    except CircuitOpenError as e:
+        print(f"DEBUG: {unit} paused: {e}")
+        lease.release(delay=e.retry_after, error=str(e), count_attempt=False)
+    except Exception as e:
+        print(f"ERROR: {unit} failed on attempt {unit.attempts}: {type(e).__name__} - {e}")
+        if unit.attempts >= settings.TRANSFER_JOB_MAX_ATTEMPTS:
+            lease.fail(f"{type(e).__name__}: {e}")
+            with transaction.atomic():
+                WorkUnit.objects.filter(transfer=unit.transfer, state=WorkUnit.STATE_PENDING).update(
+                    state=WorkUnit.STATE_FAILED, last_error=f'Transfer failed in {unit.kind}#{unit.seq}')
+                _finalize(unit.transfer, Transfer.STATUS_FAILED)
+        else:
+            lease.release(delay=min(300, 2 ** unit.attempts), error=f"{type(e).__name__}: {e}")
+    finally:
+        lease.stop()
+
+
+def run_worker(worker_id, stop_event, lease_seconds=None, poll_interval=1.0, exit_when_idle=False):
+    """Claim and run units until `stop_event` is set, or with exit_when_idle
+    until no unit is pending or leased anywhere."""
+    processed = 0
+    while not stop_event.is_set():
+        close_old_connections()
+        unit = claim(worker_id, lease_seconds)
+        if unit is None:
+            if exit_when_idle and not WorkUnit.objects.filter(
+                    state__in=[WorkUnit.STATE_PENDING, WorkUnit.STATE_LEASED]).exists():
+                break
+            stop_event.wait(poll_interval)
+            continue
+        process(unit, worker_id, lease_seconds)
+        processed += 1
+    connection.close()
+    return processed
+
+
+def transfer_progress(transfer):
+    """Per-status track counts and per-kind unit states, for the status endpoint."""
+    tracks = {
+        TrackResult(status=status).get_status_display(): n
+        for status, n in transfer.track_results.values_list('status').annotate(n=Count('id'))
+    }
+    units = {}
+    for kind, state, n in transfer.work_units.values_list('kind', 'state').annotate(n=Count('id')):
+        units.setdefault(kind, {})[state] = n
+    return {'tracks': tracks, 'work_units': units}
@@ -0,0 +1,35 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api_v1.matching import build_snapshot
+
+
+class Command(BaseCommand):
+    help = ("Compile the match cache into the memory-mapped snapshot every worker reads first. "
+            "Run it from cron (e.g. after warm_match_cache) or keep it running with --interval, more "
+            "often than settings.MATCH_SNAPSHOT_MAX_AGE_SECONDS: older snapshots are ignored.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Snapshot file (default settings.MATCH_SNAPSHOT_PATH).")
+        parser.add_argument('--max-entries', type=int, default=None,
+                            help="Newest entries to include (default settings.MATCH_SNAPSHOT_MAX_ENTRIES).")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Rebuild every this many seconds instead of once.")
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.MATCH_SNAPSHOT_PATH
+        if not path:
+            raise CommandError("No snapshot path: pass --path or set MATCH_SNAPSHOT_PATH.")
+        while True:
+            started = time.monotonic()
+            count = build_snapshot(path, options['max_entries'])
+            self.stdout.write(f"Wrote {count} entries to {path} ({os.path.getsize(path) / 1e6:.1f} MB) "
+                              f"in {time.monotonic() - started:.2f}s")
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,52 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+
+from api_v1.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Process background transfer work units. Run any number of these, on any number of hosts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help="Units processed concurrently by this process.")
+        parser.add_argument('--lease-seconds', type=int, default=None,
+                            help="Override settings.TRANSFER_JOB_LEASE_SECONDS.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait before polling again when the queue is empty.")
+        parser.add_argument('--exit-when-idle', action='store_true', help="Exit once no unit is pending or leased.")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def shutdown(signum, frame):
+            # Finish the units in hand; anything not completed is re-claimed after its lease expires
+            self.stdout.write("Stopping after current units...")
+            stop_event.set()
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        base_id = f"{socket.gethostname()}:{os.getpid()}"
+        counts = {}
+        threads = []
+        for n in range(options['threads']):
+            worker_id = f"{base_id}:{n}"
+
+            def target(worker_id=worker_id):
+                counts[worker_id] = run_worker(
+                    worker_id, stop_event,
+                    lease_seconds=options['lease_seconds'],
+                    poll_interval=options['poll_interval'],
+                    exit_when_idle=options['exit_when_idle'],
+                )
+            thread = threading.Thread(target=target, name=worker_id)
+            thread.start()
+            threads.append(thread)
+        self.stdout.write(f"Transfer worker {base_id} started with {len(threads)} thread(s)")
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+        self.stdout.write(f"Transfer worker {base_id} processed {sum(counts.values())} unit(s)")
@@ -0,0 +1,75 @@
+from datetime import datetime
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api_v1 import providers
+from api_v1.warming import popular_playlist_ids, warm
+
+
+class Command(BaseCommand):
+    help = ("Pre-resolve tracks of popular playlists into the match cache. "
+            "Meant to be scheduled off-peak, e.g. hourly from cron with --window 01:00-06:00.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('playlists', nargs='*', help="Spotify playlist IDs, URLs or URIs.")
+        parser.add_argument('--popular', type=int, default=0,
+                            help="Also warm the N playlists transferred most often recently.")
+        parser.add_argument('--days', type=int, default=30, help="How far back --popular looks.")
+        parser.add_argument('--max-tracks', type=int, default=500, help="Tracks read per playlist.")
+        parser.add_argument('--rate', type=float, default=None,
+                            help="Searches per second (default settings.MATCH_CACHE_WARM_SEARCHES_PER_SECOND).")
+        parser.add_argument('--max-searches', type=int, default=None, help="Stop after this many searches.")
+        parser.add_argument('--window', default=None,
+                            help="Only run between these local times, e.g. 01:00-06:00; otherwise exit at once.")
+        parser.add_argument('--json', action='store_true', help="Print the coverage report as JSON.")
+
+    def handle(self, *args, **options):
+        if options['window'] and not _in_window(options['window'], datetime.now().time()):
+            self.stdout.write(f"Outside the {options['window']} window, nothing to do.")
+            return
+
+        playlists = list(options['playlists']) + list(settings.MATCH_CACHE_WARM_PLAYLISTS)
+        if options['popular']:
+            playlists += popular_playlist_ids(options['popular'], options['days'])
+        playlists = list(dict.fromkeys(playlists))
+        if not playlists:
+            raise CommandError("No playlists to warm: pass some, use --popular or set MATCH_CACHE_WARM_PLAYLISTS.")
+
+        rate = options['rate'] or settings.MATCH_CACHE_WARM_SEARCHES_PER_SECOND
+        self.stdout.write(f"Warming match cache from {len(playlists)} playlist(s) at {rate:g} searches/s")
+        report = warm(
+            playlists,
+            providers.spotify_app_client(),
+            providers.ytmusic_anonymous_client(),
+            max_tracks=options['max_tracks'],
+            searches_per_second=rate,
+            max_searches=options['max_searches'],
+            log=self.stdout.write,
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for playlist in report['playlists']:
+            self.stdout.write(f"  {playlist['playlist_id']}: {playlist['unique_tracks']} tracks, coverage "
+                              f"{playlist['coverage_before']:.1%} -> {playlist['coverage_after']:.1%}")
+        self.stdout.write(
+            f"{report['unique_tracks']} unique tracks, {report['searched']} searched "
+            f"({report['resolved']} resolved, {report['fallback']} weak matches not cached, "
+            f"{report['not_found']} not found, {report['failed']} failed); "
+            f"coverage {report['coverage_before']:.1%} -> {report['coverage_after']:.1%}"
+        )
+        if report['stopped_reason']:
+            self.stdout.write(self.style.WARNING(f"Stopped early: {report['stopped_reason']}"))
+
+
+def _in_window(window, now):
+    try:
+        start, end = (datetime.strptime(part.strip(), '%H:%M').time() for part in window.split('-'))
+    except ValueError:
+        raise CommandError(f"Invalid --window {window!r}, expected HH:MM-HH:MM")
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end  # wraps past midnight
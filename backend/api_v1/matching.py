@@ -0,0 +1,128 @@
+from datetime import timedelta
+import hashlib
+import re
+import unicodedata
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import MatchCacheEntry
+from .snapshot import current_snapshot, write_snapshot
+
+
+# Parts of Spotify titles that YouTube Music usually spells differently or
+# leaves out, e.g. "Song - Remastered 2011" or "Song (feat. Someone)"
+_TITLE_NOISE = re.compile(
+    r"\s*[\(\[](feat\.?|ft\.?|with)\s[^\)\]]*[\)\]]"
+    r"|\s+-\s+(\d{4}\s+)?(remaster(ed)?|single version|radio edit|mono|stereo)\b.*$",
+    re.IGNORECASE,
+)
+
+LOOKUP_CHUNK = 500
+
+# Only search results that are songs are cached. A fallback (the first result
+# of another type, see transfers.search_song) is a weak match, and once cached
+# it would be served to every later transfer as a plain cache hit.
+CACHED_STRATEGIES = ('song',)
+
+
+# Bumped whenever normalize_key() changes, so entries stored under the old
+# keys are no longer found (and expire with MATCH_CACHE_TTL_DAYS)
+KEY_VERSION = 2
+
+
+def normalize_key(title, artist):
+    """Normalized "title|artist" used to recognise the same track across playlists.
+
+    `artist` should be the track's primary artist alone (see
+    primary_artist()): featured-artist lists vary between playlists.
+    """
+    title = _TITLE_NOISE.sub('', title or '')
+    parts = []
+    for part in (title, artist or ''):
+        # Strip accents from Latin letters ("Beyoncé" -> "beyonce"); letters
+        # and marks of other scripts are kept as they are
+        kept = []
+        for char in unicodedata.normalize('NFKD', part):
+            if unicodedata.category(char) == 'Mn' and kept and kept[-1].isascii():
+                continue
+            kept.append(char)
+        part = unicodedata.normalize('NFC', ''.join(kept)).casefold()
+        # Punctuation and symbols separate words; combining marks belong to them
+        words = ''.join(char if char.isalnum() or unicodedata.category(char)[0] == 'M' else ' ' for char in part)
+        parts.append(' '.join(words.split()))
+    return '|'.join(parts)
+
+
+def key_hash(title, artist):
+    """Signed 64-bit hash of normalize_key(), as stored in MatchCacheEntry.key_hash."""
+    key = f"{KEY_VERSION}:{normalize_key(title, artist)}"
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def primary_artist(song):
+    """The song's first listed artist; `artist` joins all of them with ", "."""
+    return song.get('primary_artist') or song['artist']
+
+
+def song_key_hash(song):
+    return key_hash(song['title'], primary_artist(song))
+
+
+def _fresh_entries():
+    entries = MatchCacheEntry.objects.all()
+    if settings.MATCH_CACHE_TTL_DAYS:
+        entries = entries.filter(updated_at__gte=timezone.now() - timedelta(days=settings.MATCH_CACHE_TTL_DAYS))
+    return entries
+
+
+def cached_matches(songs):
+    """Look up songs in the match cache.
+
+    Returns {index in songs: video_id} for the songs that have an entry.
+    The memory-mapped snapshot (api_v1.snapshot) is checked first; only
+    songs it doesn't know are looked up in the database.
+    """
+    hashes = [song_key_hash(song) for song in songs]
+    found = {}
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        for h in set(hashes):
+            video_id = snapshot.get(h)
+            if video_id:
+                found[h] = video_id
+    unique = list(set(hashes) - found.keys())
+    for start in range(0, len(unique), LOOKUP_CHUNK):
+        found.update(_fresh_entries().filter(key_hash__in=unique[start:start + LOOKUP_CHUNK])
+                     .values_list('key_hash', 'video_id'))
+    return {i: found[h] for i, h in enumerate(hashes) if h in found}
+
+
+def store_matches(matches):
+    """Save (song, video_id, strategy) tuples to the match cache, replacing older entries.
+
+    Matches with a strategy not in CACHED_STRATEGIES are left out.
+    """
+    entries = {}
+    for song, video_id, strategy in matches:
+        if video_id and strategy in CACHED_STRATEGIES:
+            h = song_key_hash(song)
+            entries[h] = MatchCacheEntry(key_hash=h, video_id=video_id, strategy=strategy)
+    if entries:
+        MatchCacheEntry.objects.bulk_create(
+            list(entries.values()), batch_size=LOOKUP_CHUNK,
+            update_conflicts=True, unique_fields=['key_hash'], update_fields=['video_id', 'strategy', 'updated_at'],
+        )
+    return len(entries)
+
+
+def build_snapshot(path=None, max_entries=None):
+    """Compile the most recently resolved cache entries into the match snapshot.
+
+    Returns the number of entries written.
+    """
+    path = path or settings.MATCH_SNAPSHOT_PATH
+    max_entries = max_entries or settings.MATCH_SNAPSHOT_MAX_ENTRIES
+    entries = _fresh_entries().order_by('-updated_at').values_list('key_hash', 'video_id')[:max_entries]
+    return write_snapshot(path, entries.iterator(chunk_size=10000))
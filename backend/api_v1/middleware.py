@@ -0,0 +1,99 @@
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .profiling import StackSampler, start_call_log, stop_call_log
+
+
+class RequestProfilingMiddleware:
+    """Profile a single request on demand.
+
+    Only installed when settings.REQUEST_PROFILING_ENABLED is true and
+    settings.REQUEST_PROFILING_TOKEN is set (otherwise Django drops it at
+    startup, so it costs nothing). A request is profiled when it carries the
+    `X-Profile-Token` header matching that token, plus the `X-Profile` header
+    or `profile` query parameter set to `sample` (the default for any other
+    value) or `cprofile`. Sampling sees every thread, including the scheduler
+    threads /transfer/ runs its searches on; cProfile only sees the request
+    thread, so those searches are missing from its profile. The profile,
+    plus a wall-clock breakdown of the outbound Spotify / YouTube Music calls
+    the request made, is written to settings.REQUEST_PROFILING_DIR and its id
+    returned in the `X-Profile-Id` response header:
+
+        <id>.prof        cProfile stats (python -m pstats / snakeviz)
+        <id>.folded      stack samples of all threads (flamegraph.pl / speedscope)
+        <id>.json        request info and outbound call breakdown
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        if not settings.REQUEST_PROFILING_TOKEN:
+            print("ERROR: REQUEST_PROFILING_ENABLED is set without REQUEST_PROFILING_TOKEN; profiling stays off")
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.output_dir = settings.REQUEST_PROFILING_DIR
+        self.token = settings.REQUEST_PROFILING_TOKEN.encode()
+
+    def __call__(self, request):
+        mode = request.headers.get('X-Profile') or request.GET.get('profile')
+        if not mode or not hmac.compare_digest(request.headers.get('X-Profile-Token', '').encode(), self.token):
+            return self.get_response(request)
+        return self._profile(request, 'cprofile' if mode == 'cprofile' else 'sample')
+
+    def _profile(self, request, mode):
+        # Only the start of the path: file names are limited to 255 bytes
+        path_part = re.sub(r'[^a-zA-Z0-9]+', '_', request.path).strip('_')[:60]
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{path_part}-{uuid.uuid4().hex[:8]}"
+        call_log, token = start_call_log()
+        profiler = cProfile.Profile() if mode == 'cprofile' else StackSampler(settings.REQUEST_PROFILING_SAMPLE_INTERVAL)
+        started = time.perf_counter()
+        if mode == 'cprofile':
+            profiler.enable()
+        else:
+            profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            if mode == 'cprofile':
+                profiler.disable()
+            else:
+                profiler.stop()
+            elapsed = time.perf_counter() - started
+            stop_call_log(token)
+
+        calls = call_log.summary()
+        base = os.path.join(self.output_dir, profile_id)
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            if mode == 'cprofile':
+                pstats.Stats(profiler).dump_stats(base + '.prof')
+            else:
+                with open(base + '.folded', 'w') as f:
+                    f.write(profiler.folded())
+            with open(base + '.json', 'w') as f:
+                json.dump({
+                    'id': profile_id,
+                    'mode': mode,
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'wall_seconds': elapsed,
+                    'outbound': calls,
+                }, f, indent=2)
+        except OSError as e:
+            # The request itself succeeded; don't turn it into a 500
+            print(f"ERROR: Could not write the profile of {request.method} {request.path}: {e}")
+            return response
+        print(f"DEBUG: Profiled {request.method} {request.path} in {elapsed:.2f}s "
+              f"({calls['total_calls']} outbound calls, {calls['total_call_seconds']:.2f}s) -> {base}.*")
+        response['X-Profile-Id'] = profile_id
+        return response
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:54
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Transfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('public_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('spotify_user_id', models.CharField(blank=True, max_length=64)),
+                ('spotify_playlist_id', models.CharField(max_length=64)),
+                ('spotify_playlist_name', models.CharField(blank=True, max_length=255)),
+                ('yt_playlist_id', models.CharField(blank=True, max_length=64)),
+                ('yt_playlist_name', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=16)),
+                ('track_count', models.PositiveIntegerField(default=0)),
+                ('found_count', models.PositiveIntegerField(default=0)),
+                ('not_found_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['spotify_user_id', '-created_at'], name='transfer_user_created_idx'), models.Index(fields=['spotify_playlist_id'], name='transfer_playlist_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('spotify_id', models.CharField(blank=True, max_length=32)),
+                ('title', models.CharField(max_length=255)),
+                ('artist', models.CharField(blank=True, max_length=255)),
+                ('video_id', models.CharField(blank=True, max_length=16)),
+                ('score', models.FloatField(blank=True, null=True)),
+                ('strategy', models.CharField(blank=True, max_length=16)),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Matched'), (2, 'Not found'), (3, 'Search failed'), (4, 'Added to playlist')])),
+                ('transfer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='track_results', to='api_v1.transfer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['transfer', 'status'], name='trackresult_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('transfer', 'position'), name='trackresult_transfer_position_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_v1', '0001_transfer_results'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transfer',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('paused', 'Paused'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=16),
+        ),
+    ]
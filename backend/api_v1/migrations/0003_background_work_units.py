@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_v1', '0002_transfer_paused_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='spotify_token',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='ytmusic_token',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='trackresult',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Pending'), (1, 'Matched'), (2, 'Not found'), (3, 'Search failed'), (4, 'Added to playlist')]),
+        ),
+        migrations.CreateModel(
+            name='WorkUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('fetch_page', 'Fetch playlist page'), ('search_batch', 'Search batch'), ('create_playlist', 'Create playlist'), ('write_batch', 'Write batch')], max_length=16)),
+                ('seq', models.PositiveIntegerField(default=0)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('leased', 'Leased'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('available_at', models.DateTimeField()),
+                ('lease_owner', models.CharField(blank=True, max_length=128)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('transfer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='work_units', to='api_v1.transfer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'available_at'], name='workunit_claim_idx'), models.Index(fields=['state', 'lease_expires_at'], name='workunit_lease_idx')],
+                'constraints': [models.UniqueConstraint(fields=('transfer', 'kind', 'seq'), name='workunit_transfer_kind_seq_uniq')],
+            },
+        ),
+    ]
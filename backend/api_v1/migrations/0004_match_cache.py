@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_v1', '0003_background_work_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_hash', models.BigIntegerField(unique=True)),
+                ('video_id', models.CharField(max_length=16)),
+                ('strategy', models.CharField(blank=True, max_length=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
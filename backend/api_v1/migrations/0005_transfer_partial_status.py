@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_v1', '0004_match_cache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transfer',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('paused', 'Paused'), ('completed', 'Completed'), ('failed', 'Failed'), ('partial', 'Partially transferred')], default='running', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_v1', '0005_transfer_partial_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackresult',
+            name='primary_artist',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,3 +1,175 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class Transfer(models.Model):
+    """One Spotify -> YouTube Music playlist transfer."""
+
+    STATUS_RUNNING = 'running'
+    STATUS_PAUSED = 'paused'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    # Background transfer that ran out of time: the playlist has the tracks
+    # matched before its deadline, the rest were skipped
+    STATUS_PARTIAL = 'partial'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_PAUSED, 'Paused'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_PARTIAL, 'Partially transferred'),
+    ]
+
+    public_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    spotify_user_id = models.CharField(max_length=64, blank=True)
+    spotify_playlist_id = models.CharField(max_length=64)
+    spotify_playlist_name = models.CharField(max_length=255, blank=True)
+    yt_playlist_id = models.CharField(max_length=64, blank=True)
+    yt_playlist_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    track_count = models.PositiveIntegerField(default=0)
+    found_count = models.PositiveIntegerField(default=0)
+    not_found_count = models.PositiveIntegerField(default=0)
+    # Background transfers only: the users' tokens, needed by whichever
+    # worker picks up the transfer's work units. Cleared once it finishes.
+    spotify_token = models.JSONField(null=True, blank=True)
+    ytmusic_token = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['spotify_user_id', '-created_at'], name='transfer_user_created_idx'),
+            models.Index(fields=['spotify_playlist_id'], name='transfer_playlist_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.spotify_playlist_name or self.spotify_playlist_id} ({self.status})"
+
+
+class TrackResult(models.Model):
+    """Outcome for a single source track of a transfer.
+
+    Kept deliberately narrow (small integer status, Spotify ID rather than
+    URL) since a large library transfer writes one row per track.
+    """
+
+    STATUS_PENDING = 0
+    STATUS_MATCHED = 1
+    STATUS_NOT_FOUND = 2
+    STATUS_FAILED = 3
+    STATUS_ADDED = 4
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_MATCHED, 'Matched'),
+        (STATUS_NOT_FOUND, 'Not found'),
+        (STATUS_FAILED, 'Search failed'),
+        (STATUS_ADDED, 'Added to playlist'),
+    ]
+
+    transfer = models.ForeignKey(Transfer, on_delete=models.CASCADE, related_name='track_results')
+    position = models.PositiveIntegerField()
+    spotify_id = models.CharField(max_length=32, blank=True)
+    title = models.CharField(max_length=255)
+    artist = models.CharField(max_length=255, blank=True)
+    # First of several artists (`artist` lists them all); blank when there is
+    # only one. Part of the match cache key, see api_v1.matching.
+    primary_artist = models.CharField(max_length=255, blank=True)
+    video_id = models.CharField(max_length=16, blank=True)
+    # Confidence in video_id, 0-1 (see api_v1.transfers.match_score); empty
+    # for matches taken from the match cache
+    score = models.FloatField(null=True, blank=True)
+    strategy = models.CharField(max_length=16, blank=True)
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transfer', 'position'], name='trackresult_transfer_position_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['transfer', 'status'], name='trackresult_status_idx'),
+        ]
+
+    @property
+    def spotify_url(self):
+        return f"https://open.spotify.com/track/{self.spotify_id}" if self.spotify_id else ''
+
+    def __str__(self):
+        return f"{self.title} - {self.artist} ({self.get_status_display()})"
+
+
+class WorkUnit(models.Model):
+    """A piece of a background transfer that any worker on any node can run.
+
+    Workers claim a unit by taking a lease on it (lease_owner +
+    lease_expires_at) and keep it alive with heartbeats while they work; a
+    unit whose lease expired, e.g. because its node died, can be claimed by
+    another worker. See api_v1.jobs.
+    """
+
+    KIND_FETCH_PAGE = 'fetch_page'
+    KIND_SEARCH_BATCH = 'search_batch'
+    KIND_CREATE_PLAYLIST = 'create_playlist'
+    KIND_WRITE_BATCH = 'write_batch'
+    KIND_CHOICES = [
+        (KIND_FETCH_PAGE, 'Fetch playlist page'),
+        (KIND_SEARCH_BATCH, 'Search batch'),
+        (KIND_CREATE_PLAYLIST, 'Create playlist'),
+        (KIND_WRITE_BATCH, 'Write batch'),
+    ]
+
+    STATE_PENDING = 'pending'
+    STATE_LEASED = 'leased'
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+    STATE_CHOICES = [
+        (STATE_PENDING, 'Pending'),
+        (STATE_LEASED, 'Leased'),
+        (STATE_DONE, 'Done'),
+        (STATE_FAILED, 'Failed'),
+    ]
+
+    transfer = models.ForeignKey(Transfer, on_delete=models.CASCADE, related_name='work_units')
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # Orders units of the same kind within a transfer; together with kind it
+    # makes enqueueing idempotent when several workers race to add a unit
+    seq = models.PositiveIntegerField(default=0)
+    payload = models.JSONField(default=dict, blank=True)
+    state = models.CharField(max_length=8, choices=STATE_CHOICES, default=STATE_PENDING)
+    available_at = models.DateTimeField()
+    lease_owner = models.CharField(max_length=128, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transfer', 'kind', 'seq'], name='workunit_transfer_kind_seq_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['state', 'available_at'], name='workunit_claim_idx'),
+            models.Index(fields=['state', 'lease_expires_at'], name='workunit_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}#{self.seq} of {self.transfer_id} ({self.state})"
+
+
+class MatchCacheEntry(models.Model):
+    """A resolved Spotify track -> YouTube Music video, reused across transfers.
+
+    Keyed by a 64-bit hash of the normalized "title | artist" (see
+    api_v1.matching.key_hash) so lookups hit a single integer index.
+    """
+
+    key_hash = models.BigIntegerField(unique=True)
+    video_id = models.CharField(max_length=16)
+    strategy = models.CharField(max_length=16, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key_hash} -> {self.video_id}"
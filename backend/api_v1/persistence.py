@@ -0,0 +1,95 @@
+from django.db import transaction
+
+from .models import TrackResult
+
+
+class TrackResultWriter:
+    """Buffers per-track results and writes them in bulk.
+
+    Writing one row per track as it is resolved costs a transaction (and on
+    SQLite an fsync) per track. Instead rows are collected here and flushed
+    with bulk_create/bulk_update inside a single transaction once
+    `batch_size` changes are pending, and on close.
+
+        with TrackResultWriter(transfer) as writer:
+            writer.add(TrackResult(...))
+            writer.update(result, ['status'])
+    """
+
+    def __init__(self, transfer, batch_size=500, using=None):
+        self.transfer = transfer
+        self.batch_size = batch_size
+        self.using = using
+        self._creates = []
+        self._create_ids = set()  # id() of the objects in _creates
+        self._updates = {}  # field names tuple -> {id(obj): obj}
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    @property
+    def pending(self):
+        return len(self._creates) + sum(len(objs) for objs in self._updates.values())
+
+    def add(self, result):
+        result.transfer = self.transfer
+        self._creates.append(result)
+        self._create_ids.add(id(result))
+        self._maybe_flush()
+        return result
+
+    def update(self, result, fields):
+        if id(result) in self._create_ids:
+            # Still waiting to be created, so the new values go in with the insert
+            return result
+        if result.pk is None:
+            # e.g. flushed on a database whose bulk_create doesn't return primary keys
+            raise ValueError(f"Can't update track result at position {result.position}: it has no primary key")
+        self._updates.setdefault(tuple(fields), {})[id(result)] = result
+        self._maybe_flush()
+        return result
+
+    def _maybe_flush(self):
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        written = 0
+        with transaction.atomic(using=self.using):
+            manager = TrackResult.objects.db_manager(self.using)
+            if self._creates:
+                manager.bulk_create(self._creates, batch_size=self.batch_size)
+                written += len(self._creates)
+            for fields, objs in self._updates.items():
+                written += self._write_updates(manager, fields, list(objs.values()))
+        self._creates = []
+        self._create_ids = set()
+        self._updates = {}
+        self.rows_written += written
+        return written
+
+    def _write_updates(self, manager, fields, objs):
+        # The common case is many rows getting the same values (e.g. every
+        # matched track flipped to "added"); a plain UPDATE ... WHERE id IN
+        # is far cheaper than the CASE expression bulk_update builds.
+        groups = {}
+        for obj in objs:
+            values = tuple(getattr(obj, field) for field in fields)
+            groups.setdefault(values, []).append(obj)
+        mixed = []
+        for values, group in groups.items():
+            if len(group) == 1:
+                mixed.extend(group)
+                continue
+            pks = [obj.pk for obj in group]
+            for start in range(0, len(pks), self.batch_size):
+                manager.filter(pk__in=pks[start:start + self.batch_size]).update(**dict(zip(fields, values)))
+        if mixed:
+            manager.bulk_update(mixed, fields, batch_size=self.batch_size)
+        return len(objs)
@@ -0,0 +1,106 @@
+import collections
+import contextvars
+import sys
+import threading
+import time
+
+
+# Set only while a profiled request is running; providers.GuardedClient
+# reports every outbound API call to it. Unset (the normal case) recording
+# is a single ContextVar lookup.
+_call_log = contextvars.ContextVar('outbound_call_log', default=None)
+
+
+class OutboundCallLog:
+    """Wall-clock timings of the outbound API calls made for one request.
+
+    Scheduler tasks run in a copy of the request's context, so searches done
+    on worker threads are recorded here too.
+    """
+
+    def __init__(self):
+        self.calls = []  # (provider, method, started, elapsed, ok); list.append is thread-safe
+        self.started = time.perf_counter()
+
+    def record(self, provider, method, started, elapsed, ok):
+        self.calls.append((provider, method, started - self.started, elapsed, ok))
+
+    def summary(self):
+        by_method = collections.defaultdict(lambda: {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        for provider, method, _, elapsed, ok in self.calls:
+            entry = by_method[f'{provider}.{method}']
+            entry['calls'] += 1
+            entry['errors'] += 0 if ok else 1
+            entry['total_seconds'] += elapsed
+            entry['max_seconds'] = max(entry['max_seconds'], elapsed)
+        return {
+            'total_calls': len(self.calls),
+            'total_call_seconds': sum(call[3] for call in self.calls),
+            'by_method': dict(sorted(by_method.items(), key=lambda item: -item[1]['total_seconds'])),
+            'calls': [
+                {'provider': p, 'method': m, 'offset_seconds': round(o, 6), 'seconds': round(e, 6), 'ok': ok}
+                for p, m, o, e, ok in self.calls
+            ],
+        }
+
+
+def start_call_log():
+    log = OutboundCallLog()
+    return log, _call_log.set(log)
+
+
+def stop_call_log(token):
+    _call_log.reset(token)
+
+
+def record_call(provider, method, started, elapsed, ok):
+    log = _call_log.get()
+    if log is not None:
+        log.record(provider, method, started, elapsed, ok)
+
+
+def current_call_log():
+    return _call_log.get()
+
+
+class StackSampler:
+    """Samples the stacks of every thread at a fixed interval.
+
+    Unlike cProfile this also sees the scheduler's worker threads, and its
+    cost doesn't grow with the number of function calls. Output is in the
+    "folded" format understood by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
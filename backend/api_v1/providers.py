@@ -0,0 +1,279 @@
+from functools import lru_cache
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from .admission import record_provider_call
+from .breakers import CircuitOpenError, get_breaker
+from .deadlines import DeadlineExceeded, call_timeout, check_deadline
+from .profiling import record_call
+
+
+# The provider SDKs (spotipy, ytmusicapi, google-auth-oauthlib) are only
+# imported the first time a view actually needs them, so worker boot,
+# manage.py commands and autoreload don't pay for all three up front.
+
+SPOTIFY_SCOPE = "playlist-read-private playlist-read-collaborative"
+YTMUSIC_SCOPES = ["https://www.googleapis.com/auth/youtube"]
+
+
+@lru_cache(maxsize=None)
+def _spotipy():
+    import spotipy
+    return spotipy
+
+
+@lru_cache(maxsize=None)
+def _spotify_client_class():
+    class PooledSpotify(_spotipy().Spotify):
+        # spotipy closes its session when a client is garbage collected,
+        # which would drop every kept-alive connection of the shared one
+        def __del__(self):
+            pass
+    return PooledSpotify
+
+
+# ytmusicapi's own default per-request timeout
+YTMUSIC_REQUEST_TIMEOUT = 30
+
+
+@lru_cache(maxsize=None)
+def _deadline_session_class():
+    import requests
+
+    class DeadlineSession(requests.Session):
+        """Session whose requests time out no later than the current
+        transfer deadline (see api_v1.deadlines).
+
+        `default_timeout` applies to requests made without one. A request cut
+        short because the deadline was nearer raises DeadlineExceeded rather
+        than a plain timeout, so it isn't blamed on the provider.
+        """
+
+        default_timeout = None
+
+        def request(self, method, url, **kwargs):
+            timeout = kwargs.get('timeout') or self.default_timeout
+            if isinstance(timeout, tuple):
+                limited = False
+                capped = []
+                for part in timeout:
+                    part, part_limited = call_timeout(part)
+                    capped.append(part)
+                    limited = limited or part_limited
+                timeout = tuple(capped)
+            else:
+                timeout, limited = call_timeout(timeout)
+            kwargs['timeout'] = timeout
+            try:
+                return super().request(method, url, **kwargs)
+            except requests.Timeout as e:
+                if limited:
+                    raise DeadlineExceeded("transfer deadline exceeded during a provider call") from e
+                raise
+    return DeadlineSession
+
+
+@lru_cache(maxsize=None)
+def spotify_session():
+    """The requests session shared by every Spotify client in this process.
+
+    Clients are built per request/token, but all of them reuse this
+    session's connection pool, so consecutive calls skip the TCP and TLS
+    handshake. Retries match spotipy's own defaults. spotipy sends the
+    Authorization header per call, so sharing it across users is safe.
+    Each request's timeout is capped by the transfer deadline.
+    """
+    import requests
+    from urllib3.util.retry import Retry
+
+    spotify = _spotipy().Spotify
+    retry = Retry(
+        total=spotify.max_retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=spotify.max_retries,
+        backoff_factor=0.3,
+        status_forcelist=spotify.default_retry_codes,
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        max_retries=retry,
+        pool_connections=2,
+        pool_maxsize=settings.SPOTIFY_HTTP_POOL_SIZE,
+    )
+    session = _deadline_session_class()()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@lru_cache(maxsize=None)
+def _spotify_oauth_class():
+    from spotipy.oauth2 import SpotifyOAuth
+    return SpotifyOAuth
+
+
+@lru_cache(maxsize=None)
+def _spotify_client_credentials_class():
+    from spotipy.oauth2 import SpotifyClientCredentials
+    return SpotifyClientCredentials
+
+
+@lru_cache(maxsize=None)
+def _ytmusic():
+    import ytmusicapi
+    return ytmusicapi
+
+
+@lru_cache(maxsize=None)
+def _google_flow_class():
+    from google_auth_oauthlib.flow import Flow
+    return Flow
+
+
+@lru_cache(maxsize=None)
+def _ytmusic_client_config():
+    return {
+        "web": {
+            "client_id": settings.YTM_CLIENT_ID,
+            "client_secret": settings.YTM_CLIENT_SECRET,
+            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }
+    }
+
+
+@lru_cache(maxsize=None)
+def _ytmusic_oauth_credentials():
+    return _ytmusic().OAuthCredentials(
+        client_id=settings.YTM_CLIENT_ID,
+        client_secret=settings.YTM_CLIENT_SECRET
+    )
+
+
+class GuardedClient:
+    """Wraps a provider SDK client so every API call goes through the
+    provider's circuit breaker (see api_v1.breakers), counts against its
+    quota (see api_v1.admission), respects the transfer deadline (see
+    api_v1.deadlines) and is timed for request profiling (see
+    api_v1.profiling)."""
+
+    def __init__(self, provider, client):
+        self._provider = provider
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+        breaker = get_breaker(self._provider)
+
+        def guarded(*args, **kwargs):
+            return self._call(name, attr, args, kwargs, breaker)
+        return guarded
+
+    def uncounted(self, name, *args, **kwargs):
+        """Call the client's `name` method without the outcome counting
+        towards the circuit breaker, for calls that mostly fail through the
+        user's fault, like checking their token. An open circuit still
+        rejects the call."""
+        breaker = get_breaker(self._provider)
+        if breaker.state == breaker.OPEN:
+            raise CircuitOpenError(self._provider, breaker.retry_after())
+        return self._call(name, getattr(self._client, name), args, kwargs)
+
+    def _call(self, name, fn, args, kwargs, breaker=None):
+        # Don't start a call the transfer no longer has time for
+        check_deadline()
+        record_provider_call(self._provider)
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = breaker.call(fn, *args, **kwargs) if breaker else fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            record_call(self._provider, name, started, time.perf_counter() - started, ok)
+
+    @property
+    def unwrapped(self):
+        return self._client
+
+
+def spotify_oauth(redirect_uri):
+    """Build the Spotify OAuth manager for the given callback URL."""
+    return _spotify_oauth_class()(
+        client_id=settings.SPOTIPY_CLIENT_ID,
+        client_secret=settings.SPOTIPY_CLIENT_SECRET,
+        redirect_uri=redirect_uri,
+        scope=SPOTIFY_SCOPE,
+    )
+
+
+def spotify_client(access_token):
+    """Build a Spotify API client for a user's access token."""
+    return GuardedClient('spotify', _spotify_client_class()(auth=access_token, requests_session=spotify_session()))
+
+
+def spotify_app_client():
+    """Spotify client authenticated as the app itself (client credentials),
+    for reading public playlists without a user."""
+    auth_manager = _spotify_client_credentials_class()(
+        client_id=settings.SPOTIPY_CLIENT_ID,
+        client_secret=settings.SPOTIPY_CLIENT_SECRET,
+    )
+    return GuardedClient('spotify', _spotify_client_class()(auth_manager=auth_manager, requests_session=spotify_session()))
+
+
+def _ytmusic_session():
+    session = _deadline_session_class()()
+    session.default_timeout = YTMUSIC_REQUEST_TIMEOUT
+    return session
+
+
+def ytmusic_anonymous_client():
+    """Unauthenticated YTMusic client; enough for searching."""
+    return GuardedClient('ytmusic', _ytmusic().YTMusic(requests_session=_ytmusic_session()))
+
+
+def ytmusic_flow(redirect_uri):
+    """Build the Google OAuth flow used for YouTube Music.
+
+    The client config and Flow class are memoized; the Flow itself is not,
+    because it carries per-user state (PKCE verifier, fetched token).
+    """
+    flow = _google_flow_class().from_client_config(_ytmusic_client_config(), scopes=YTMUSIC_SCOPES)
+    flow.redirect_uri = redirect_uri
+    return flow
+
+
+def ytmusic_client(ytmusic_token_info):
+    """Build a YTMusic client for a user's token.
+
+    Returns the client and the path of the temporary token file backing it;
+    the caller is responsible for removing that file.
+    """
+    # Create a temporary file to store the token
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
+        # Write the token info in the format expected by YTMusic
+        token_data = {
+            "access_token": ytmusic_token_info['access_token'],
+            "refresh_token": ytmusic_token_info.get('refresh_token'),
+            "scope": ytmusic_token_info.get('scopes', YTMUSIC_SCOPES),
+            "token_type": "Bearer",
+            "expires_at": ytmusic_token_info.get('expires_at')
+        }
+        json.dump(token_data, temp_file)
+        temp_token_file = temp_file.name
+
+    try:
+        ytmusic = _ytmusic().YTMusic(auth=temp_token_file, oauth_credentials=_ytmusic_oauth_credentials(),
+                                     requests_session=_ytmusic_session())
+    except Exception:
+        os.unlink(temp_token_file)
+        raise
+    return GuardedClient('ytmusic', ytmusic), temp_token_file
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+
+from .models import TrackResult
+
+
+# Per-track transfer reports (GET /api/v1/transfers/<id>/report/). Rows are
+# read from TrackResult in position order with a keyset cursor ("tracks
+# after position N") and streamed out as they are read, so a report for a
+# 10k-track library is never held in memory or built as one JSON document.
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+COLUMNS = ['position', 'spotify_id', 'spotify_url', 'title', 'artist',
+           'video_id', 'youtube_url', 'score', 'strategy', 'status']
+
+STATUS_NAMES = {
+    TrackResult.STATUS_PENDING: 'pending',
+    TrackResult.STATUS_MATCHED: 'matched',
+    TrackResult.STATUS_NOT_FOUND: 'not_found',
+    TrackResult.STATUS_FAILED: 'failed',
+    TrackResult.STATUS_ADDED: 'added',
+}
+
+_FIELDS = ['position', 'spotify_id', 'title', 'artist', 'video_id', 'score', 'strategy', 'status']
+
+# Rows fetched from the database / written to the response at a time
+CHUNK_SIZE = 500
+
+# json.dumps() with any option builds a new encoder per call; rows reuse one
+_encode_json = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def page(transfer, after=None, limit=1000):
+    """One page of a transfer's report: (rows, next_cursor).
+
+    `rows` is a lazy iterator of row dicts for the tracks after position
+    `after`; next_cursor is the position to pass as `after` for the
+    following page, or None on the last one. Only the page boundary is
+    looked up up front (on the transfer/position index); the rows
+    themselves are read in chunks while they are being consumed.
+    """
+    results = TrackResult.objects.filter(transfer=transfer)
+    if after is not None:
+        results = results.filter(position__gt=after)
+    results = results.order_by('position')
+    boundary = list(results.values_list('position', flat=True)[limit - 1:limit + 1])
+    next_cursor = boundary[0] if len(boundary) == 2 else None
+    if next_cursor is not None:
+        results = results.filter(position__lte=next_cursor)
+    rows = results.values_list(*_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    return (_row(values) for values in rows), next_cursor
+
+
+def _row(values):
+    row = dict(zip(_FIELDS, values))
+    row['spotify_url'] = f"https://open.spotify.com/track/{row['spotify_id']}" if row['spotify_id'] else ''
+    row['youtube_url'] = f"https://music.youtube.com/watch?v={row['video_id']}" if row['video_id'] else ''
+    row['status'] = STATUS_NAMES.get(row['status'], str(row['status']))
+    return {column: row[column] for column in COLUMNS}
+
+
+def _chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def ndjson(rows):
+    """One JSON object per line."""
+    return _chunked(_encode_json(row) + '\n' for row in rows)
+
+
+def csv_lines(rows):
+    """CSV with a header row; every page is a complete CSV file."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS, lineterminator='\n')
+
+    def lines():
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            line = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            yield line
+        yield buffer.getvalue()
+
+    return _chunked(lines())
+
+
+def render(rows, output_format):
+    """The response body for `rows` in one of FORMATS, as an iterator of text chunks."""
+    if output_format == 'csv':
+        return csv_lines(rows)
+    return ndjson(rows)
@@ -0,0 +1,170 @@
+import collections
+from concurrent.futures import Future
+import contextvars
+import threading
+
+from django.conf import settings
+
+
+class _Task:
+    __slots__ = ('job', 'fn', 'args', 'kwargs', 'future', 'context', 'finish_tag')
+
+    def __init__(self, job, fn, args, kwargs):
+        self.job = job
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        # Run the task with the submitter's context (deadlines, profiling, ...)
+        self.context = contextvars.copy_context()
+        self.finish_tag = 0.0
+
+
+class _UserQueue:
+    __slots__ = ('user_id', 'weight', 'tasks', 'last_finish', 'running')
+
+    def __init__(self, user_id, weight):
+        self.user_id = user_id
+        self.weight = weight
+        self.tasks = collections.deque()  # appended in finish-tag order
+        self.last_finish = 0.0
+        self.running = 0
+
+
+class Job:
+    """Handle for one transfer's search work; see FairScheduler.job()."""
+
+    def __init__(self, scheduler, user_id, size, weight):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.size = size
+        self.weight = weight
+        self.fast_lane = size <= scheduler.small_job_tracks
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return a concurrent.futures.Future."""
+        return self.scheduler._submit(self, fn, args, kwargs)
+
+
+class FairScheduler:
+    """Shared worker pool that interleaves search work from all transfers.
+
+    Tasks are ordered with self-clocked weighted fair queuing per user, so a
+    user migrating a huge library gets the same share of workers as one
+    moving a 20-track playlist instead of everything they queued first.
+    Jobs no bigger than `small_job_tracks` go in a fast lane that is served
+    ahead of the fair queue, and no user ever has more than
+    `per_user_concurrency` tasks running at once (which also bounds how much
+    of a provider's quota a single user can burn through).
+    """
+
+    def __init__(self, workers=8, per_user_concurrency=2, small_job_tracks=50):
+        self.workers = workers
+        self.per_user_concurrency = per_user_concurrency
+        self.small_job_tracks = small_job_tracks
+        self._lock = threading.Condition()
+        self._lanes = ({}, {})  # (fast, fair): user_id -> _UserQueue
+        self._virtual_time = 0.0
+        self._threads = []
+
+    def job(self, user_id, size, weight=1.0):
+        """Register a unit of work for `user_id` made of roughly `size` tasks."""
+        return Job(self, user_id or '', size, weight)
+
+    def stats(self):
+        with self._lock:
+            queued = {}
+            running = {}
+            for lane in self._lanes:
+                for queue in lane.values():
+                    queued[queue.user_id] = queued.get(queue.user_id, 0) + len(queue.tasks)
+                    running[queue.user_id] = running.get(queue.user_id, 0) + queue.running
+            return {
+                'workers': self.workers,
+                'queued_tasks': sum(queued.values()),
+                'running_tasks': sum(running.values()),
+                'active_users': len([u for u in queued if queued[u] or running[u]]),
+            }
+
+    def _submit(self, job, fn, args, kwargs):
+        task = _Task(job, fn, args, kwargs)
+        with self._lock:
+            lane = self._lanes[0 if job.fast_lane else 1]
+            queue = lane.get(job.user_id)
+            if queue is None:
+                queue = lane[job.user_id] = _UserQueue(job.user_id, job.weight)
+            queue.weight = job.weight
+            start = max(self._virtual_time, queue.last_finish)
+            task.finish_tag = start + 1.0 / queue.weight
+            queue.last_finish = task.finish_tag
+            queue.tasks.append(task)
+            self._ensure_workers()
+            self._lock.notify()
+        return task.future
+
+    def _running_for(self, user_id):
+        return sum(lane[user_id].running for lane in self._lanes if user_id in lane)
+
+    def _next_task(self):
+        # Called with the lock held. Fast lane first, then the fair queue;
+        # within a lane, the eligible user whose head task finishes earliest.
+        for lane in self._lanes:
+            candidates = [
+                queue for queue in lane.values()
+                if queue.tasks and self._running_for(queue.user_id) < self.per_user_concurrency
+            ]
+            if candidates:
+                queue = min(candidates, key=lambda q: q.tasks[0].finish_tag)
+                task = queue.tasks.popleft()
+                queue.running += 1
+                self._virtual_time = max(self._virtual_time, task.finish_tag)
+                return task, queue
+        return None, None
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"transfer-search-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                task, queue = self._next_task()
+                while task is None:
+                    self._lock.wait()
+                    task, queue = self._next_task()
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        result = task.context.run(task.fn, *task.args, **task.kwargs)
+                    except BaseException as e:
+                        task.future.set_exception(e)
+                    else:
+                        task.future.set_result(result)
+            finally:
+                with self._lock:
+                    queue.running -= 1
+                    lane = self._lanes[0 if task.job.fast_lane else 1]
+                    if not queue.tasks and not queue.running:
+                        lane.pop(queue.user_id, None)
+                    # A slot freed up for this user, so any waiting worker may now have work
+                    self._lock.notify_all()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler configured from settings."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = FairScheduler(
+                    workers=settings.TRANSFER_SEARCH_WORKERS,
+                    per_user_concurrency=settings.TRANSFER_PER_USER_CONCURRENCY,
+                    small_job_tracks=settings.TRANSFER_SMALL_JOB_TRACKS,
+                )
+    return _scheduler
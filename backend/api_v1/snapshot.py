@@ -0,0 +1,184 @@
+from array import array
+from bisect import bisect_left
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+# A match snapshot is an immutable file holding the hot part of the match
+# cache (api_v1.matching) as key_hash -> video_id:
+#
+#   header   magic, format version, byte order, entry count, build time
+#   keys     count signed 64-bit key hashes, ascending
+#   values   count VALUE_SIZE-byte video IDs, NUL padded, in key order
+#
+# Every worker process maps the same file read-only, so the OS page cache
+# holds a single copy however many workers there are, and a lookup is a
+# binary search over the mapped keys with no locks and no copying. A new
+# snapshot is written next to the old one and renamed over it; readers
+# notice the new file on their next check and switch to it, while lookups
+# already running finish on the mapping they started with.
+
+MAGIC = b'S2YMATCH'
+VERSION = 1
+_HEADER = struct.Struct('=8sBc2xIdQ')  # magic, version, byte order, count, built_at, padding to 32
+VALUE_SIZE = 16  # MatchCacheEntry.video_id max_length
+_BYTE_ORDER = b'<' if sys.byteorder == 'little' else b'>'
+
+
+def write_snapshot(path, entries, built_at=None):
+    """Atomically replace the snapshot at `path` with the given (key_hash, video_id) pairs."""
+    entries = sorted(dict(entries).items())
+    keys = array('q', (key for key, _ in entries))
+    values = b''.join(video_id.encode()[:VALUE_SIZE].ljust(VALUE_SIZE, b'\0') for _, video_id in entries)
+    header = _HEADER.pack(MAGIC, VERSION, _BYTE_ORDER, len(entries), built_at or time.time(), 0)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix='.match-snapshot-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(keys.tobytes())
+            f.write(values)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    return len(entries)
+
+
+class MatchSnapshot:
+    """One snapshot file, mapped read-only."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            raise ValueError(f"{path} is not a match snapshot")
+        magic, version, byte_order, count, built_at, _ = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or byte_order != _BYTE_ORDER:
+            raise ValueError(f"{path} is not a version {VERSION} match snapshot for this platform")
+        keys_end = _HEADER.size + 8 * count
+        if len(self._map) != keys_end + VALUE_SIZE * count:
+            raise ValueError(f"{path} is truncated")
+        self.path = path
+        self.count = count
+        self.built_at = built_at
+        self._keys = memoryview(self._map)[_HEADER.size:keys_end].cast('q')
+        self._values_offset = keys_end
+
+    def __len__(self):
+        return self.count
+
+    def get(self, key_hash):
+        """The video ID stored for `key_hash`, or None."""
+        index = bisect_left(self._keys, key_hash)
+        if index == self.count or self._keys[index] != key_hash:
+            return None
+        offset = self._values_offset + index * VALUE_SIZE
+        return self._map[offset:offset + VALUE_SIZE].rstrip(b'\0').decode()
+
+
+class SnapshotReader:
+    """Keeps the newest snapshot at `path` open for lookups.
+
+    current() re-checks the file at most every `check_seconds`. Only that
+    check takes a lock, and a thread that finds it held just keeps using
+    the snapshot it has. Replaced snapshots are never closed explicitly;
+    their mapping goes away once the last lookup using it drops it.
+    """
+
+    def __init__(self, path, check_seconds=30.0):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._snapshot = None
+        self._checked_at = None
+        self._reload_lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if (self._checked_at is None or now - self._checked_at >= self.check_seconds) \
+                and self._reload_lock.acquire(blocking=False):
+            try:
+                self._checked_at = now
+                self._reload()
+            finally:
+                self._reload_lock.release()
+        return self._snapshot
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._snapshot = None
+            return
+        current = self._snapshot
+        if current is not None and current.identity == (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return
+        try:
+            self._snapshot = MatchSnapshot(self.path)
+            print(f"DEBUG: Loaded match snapshot {self.path} with {self._snapshot.count} entries")
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not load match snapshot {self.path}: {e}")
+
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def _loaded_snapshot():
+    global _reader
+    if not settings.MATCH_SNAPSHOT_PATH:
+        return None
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                _reader = SnapshotReader(settings.MATCH_SNAPSHOT_PATH, settings.MATCH_SNAPSHOT_CHECK_SECONDS)
+    return _reader.current()
+
+
+def _is_stale(snapshot):
+    max_age = settings.MATCH_SNAPSHOT_MAX_AGE_SECONDS
+    return bool(max_age) and time.time() - snapshot.built_at > max_age
+
+
+def current_snapshot():
+    """This process's view of settings.MATCH_SNAPSHOT_PATH, or None if there is no snapshot.
+
+    A snapshot older than settings.MATCH_SNAPSHOT_MAX_AGE_SECONDS is ignored:
+    it means build_match_snapshot stopped running, and the database, which
+    applies MATCH_CACHE_TTL_DAYS, is used instead.
+    """
+    snapshot = _loaded_snapshot()
+    if snapshot is None or _is_stale(snapshot):
+        return None
+    return snapshot
+
+
+def snapshot_stats():
+    # Served by the unauthenticated /metrics/ endpoint, so no filesystem path
+    snapshot = _loaded_snapshot()
+    if snapshot is None:
+        return None
+    return {
+        'entries': snapshot.count,
+        'age_seconds': round(time.time() - snapshot.built_at, 1),
+        'max_age_seconds': settings.MATCH_SNAPSHOT_MAX_AGE_SECONDS or None,
+        # Too old to be used; see current_snapshot()
+        'stale': _is_stale(snapshot),
+    }
@@ -1,3 +1,1036 @@
-from django.test import TestCase
+from datetime import timedelta
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import admission, jobs, providers, reports, snapshot
+from .admission import AdmissionController, AdmissionRejected, ProviderQuota
+from .breakers import CircuitBreaker, CircuitOpenError
+from .deadlines import Deadline, DeadlineExceeded, call_timeout, current_deadline, deadline
+from .hedging import Hedger
+from .matching import cached_matches, key_hash, normalize_key, song_key_hash, store_matches
+from .middleware import RequestProfilingMiddleware
+from .models import MatchCacheEntry, Transfer, TrackResult, WorkUnit
+from .persistence import TrackResultWriter
+from .scheduler import FairScheduler
+from .transfers import hydrate_songs, match_score, search_song, song_from_track
+from .warming import warm
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeSpotify:
+    """Playlists of `count` tracks each, by playlist ID."""
+
+    def __init__(self, playlists):
+        self.playlists = playlists
+
+    def current_user(self):
+        return {'id': 'user1'}
+
+    def _items(self, playlist_id, offset, limit):
+        return [
+            {'track': {'id': f'{playlist_id}-{i}', 'name': f'{playlist_id} song {i}', 'artists': [{'name': 'Artist'}],
+                       'duration_ms': 200000}}
+            for i in range(offset, min(offset + limit, self.playlists[playlist_id]))
+        ]
+
+    def playlist(self, playlist_id, fields=None):
+        count = self.playlists[playlist_id]
+        return {'name': playlist_id, 'tracks': {'total': count, 'items': self._items(playlist_id, 0, 100)}}
+
+    def playlist_items(self, playlist_id, offset=0, limit=100, fields=None):
+        more = offset + limit < self.playlists[playlist_id]
+        return {'items': self._items(playlist_id, offset, limit), 'next': 'next' if more else None}
+
+
+class FakeYTMusic:
+    """Finds one song per query and records playlist writes; every add succeeds."""
+
+    def __init__(self, result_type='song'):
+        self.result_type = result_type
+        self.add_status = 'STATUS_SUCCEEDED'
+        self.adds = []
+        self.video_ids = {}
+        self.playlists_created = 0
+
+    def get_library_playlists(self, limit=25):
+        return []
+
+    def search(self, query, filter=None, limit=20):
+        video_id = self.video_ids.setdefault(query, f'v{len(self.video_ids)}')
+        return [{'resultType': self.result_type, 'videoId': video_id, 'duration_seconds': 200}]
+
+    def create_playlist(self, **kwargs):
+        self.playlists_created += 1
+        return 'PLtest'
+
+    def add_playlist_items(self, playlist_id, video_ids):
+        if 'SUCCEEDED' in self.add_status:
+            self.adds.append(list(video_ids))
+        return {'status': self.add_status}
+
+    def get_playlist(self, playlist_id, limit=100):
+        return {'tracks': [{'videoId': video_id} for add in self.adds for video_id in add]}
+
+
+def run_units(ytmusic):
+    """Claim and process units until none is available."""
+    with mock.patch.object(jobs.providers, 'ytmusic_client', return_value=(ytmusic, '/nonexistent/token')):
+        while True:
+            unit = jobs.claim('worker-test')
+            if unit is None:
+                return
+            jobs.process(unit, 'worker-test')
+
+
+@override_settings(MATCH_SNAPSHOT_PATH='')
+class TransferViewTestCase(TestCase):
+    """Runs /transfer/ against FakeSpotify and FakeYTMusic."""
+
+    def setUp(self):
+        self.spotify = FakeSpotify({'pl12': 12, 'pl30': 30})
+        self.ytmusic = FakeYTMusic()
+
+    def post_transfer(self, **body):
+        body = {'spotify_token': {'access_token': 'sp'}, 'ytmusic_token': {'access_token': 'yt'}, **body}
+        spotify = providers.GuardedClient('spotify', self.spotify)
+        ytmusic = providers.GuardedClient('ytmusic', self.ytmusic)
+        with mock.patch.object(providers, 'spotify_client', return_value=spotify), \
+                mock.patch.object(providers, 'ytmusic_client', return_value=(ytmusic, '/nonexistent/token')):
+            return self.client.post(reverse('transfer_playlist'), json.dumps(body), content_type='application/json')
+
+
+class ResumeTransferTests(TransferViewTestCase):
+    def test_resume_with_another_playlist_is_refused(self):
+        transfer = Transfer.objects.create(spotify_user_id='user1', spotify_playlist_id='pl30', track_count=30,
+                                           yt_playlist_name='pl30 (from Spotify)', status=Transfer.STATUS_PAUSED)
+        response = self.post_transfer(playlist_identifier='pl12', transfer_id=str(transfer.public_id))
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(transfer.track_results.exists())
+        transfer.refresh_from_db()
+        self.assertEqual(transfer.status, Transfer.STATUS_PAUSED)
+        self.assertEqual(transfer.track_count, 30)
+
+        response = self.post_transfer(playlist_identifier='pl30', transfer_id=str(transfer.public_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(transfer.track_results.filter(status=TrackResult.STATUS_ADDED).count(), 30)
+
+
+class PlaylistWriteTests(TransferViewTestCase):
+    def test_rejected_add_pauses_and_resume_adds_each_video_once(self):
+        self.ytmusic.add_status = 'STATUS_FAILED'
+        response = self.post_transfer(playlist_identifier='pl12')
+        self.assertEqual(response.status_code, 502)
+        transfer = Transfer.objects.get(public_id=response.json()['transfer_id'])
+        self.assertEqual(transfer.status, Transfer.STATUS_PAUSED)
+        self.assertEqual(transfer.yt_playlist_id, 'PLtest')
+        self.assertEqual(transfer.track_results.filter(status=TrackResult.STATUS_MATCHED).count(), 12)
+
+        self.ytmusic.add_status = 'STATUS_SUCCEEDED'
+        response = self.post_transfer(playlist_identifier='pl12', transfer_id=str(transfer.public_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ytmusic.playlists_created, 1)
+        self.assertEqual(len(self.ytmusic.adds), 1)
+        self.assertEqual(sorted(self.ytmusic.adds[0]), sorted(set(self.ytmusic.video_ids.values())))
+        self.assertEqual(transfer.track_results.filter(status=TrackResult.STATUS_ADDED).count(), 12)
+
+
+class TrackResultWriterTests(TestCase):
+    def setUp(self):
+        self.transfer = Transfer.objects.create(spotify_playlist_id='pl', track_count=10)
+
+    def result(self, position):
+        return TrackResult(position=position, title=f'Song {position}', status=TrackResult.STATUS_PENDING)
+
+    def statuses(self):
+        return list(self.transfer.track_results.order_by('position').values_list('status', flat=True))
+
+    def test_rows_are_written_in_batches(self):
+        writer = TrackResultWriter(self.transfer, batch_size=3)
+        for position in range(4):
+            writer.add(self.result(position))
+        self.assertEqual(writer.rows_written, 3)
+        self.assertEqual(writer.pending, 1)
+        writer.flush()
+        self.assertEqual(self.statuses(), [TrackResult.STATUS_PENDING] * 4)
+
+    def test_update_before_flush_goes_in_with_the_insert(self):
+        with TrackResultWriter(self.transfer) as writer:
+            result = writer.add(self.result(0))
+            result.status = TrackResult.STATUS_MATCHED
+            writer.update(result, ['status'])
+            self.assertEqual(writer.pending, 1)
+        self.assertEqual(self.statuses(), [TrackResult.STATUS_MATCHED])
+
+    def test_updates_after_flush(self):
+        with TrackResultWriter(self.transfer) as writer:
+            results = [writer.add(self.result(position)) for position in range(4)]
+        with TrackResultWriter(self.transfer) as writer:
+            # Same values for several rows, and one row of its own
+            for result, status in zip(results, [TrackResult.STATUS_ADDED, TrackResult.STATUS_ADDED,
+                                                TrackResult.STATUS_NOT_FOUND, TrackResult.STATUS_ADDED]):
+                result.status = status
+                writer.update(result, ['status'])
+        self.assertEqual(self.statuses(), [TrackResult.STATUS_ADDED, TrackResult.STATUS_ADDED,
+                                           TrackResult.STATUS_NOT_FOUND, TrackResult.STATUS_ADDED])
+
+    def test_update_of_written_row_without_primary_key_raises(self):
+        with TrackResultWriter(self.transfer) as writer:
+            result = writer.add(self.result(0))
+        # As left by a database whose bulk_create doesn't return primary keys
+        result.pk = None
+        with self.assertRaises(ValueError):
+            TrackResultWriter(self.transfer).update(result, ['status'])
+        with self.assertRaises(ValueError):
+            writer.update(result, ['status'])
+
+
+class MatchKeyTests(SimpleTestCase):
+    def test_non_latin_letters_are_kept(self):
+        self.assertEqual(normalize_key('Кино', 'Виктор Цой'), 'кино|виктор цой')
+        self.assertEqual(normalize_key('봄날', 'BTS'), '봄날|bts')
+        # Devanagari vowel signs are combining marks
+        self.assertEqual(normalize_key('तुम ही हो', 'Arijit Singh'), 'तुम ही हो|arijit singh')
+        self.assertNotEqual(key_hash('Кино', 'Виктор Цой'), key_hash('Звезда', 'Виктор Цой'))
+        self.assertNotEqual(key_hash('तुम ही हो', 'Arijit Singh'), key_hash('तू ही है', 'Arijit Singh'))
+
+    def test_accents_are_stripped_from_latin_letters(self):
+        self.assertEqual(normalize_key('Déjà Vu', 'Beyoncé'), 'deja vu|beyonce')
+
+    def test_title_noise_is_stripped(self):
+        for title in ('Song (feat. Someone)', 'Song [ft. Someone]', 'Song (with Someone)',
+                      'Song - Remastered 2011', 'Song - 2011 Remaster', 'Song - Radio Edit'):
+            self.assertEqual(normalize_key(title, 'Artist'), 'song|artist', title)
+
+    def test_primary_artist_with_a_comma(self):
+        def song(*artists):
+            return song_from_track({'id': 'x', 'name': 'See You Again', 'artists': [{'name': a} for a in artists]})
+
+        self.assertEqual(song_key_hash(song('Tyler, The Creator', 'Kali Uchis')),
+                         song_key_hash(song('Tyler, The Creator')))
+        self.assertNotEqual(song_key_hash(song('Tyler, The Creator')), song_key_hash(song('Tyler')))
+
+
+class HydrateSongsTests(SimpleTestCase):
+    def test_durations_are_loaded_fifty_tracks_per_call(self):
+        class Spotify:
+            calls = []
+
+            def tracks(self, ids):
+                self.calls.append(len(ids))
+                return {'tracks': [{'id': track_id, 'name': 'Song', 'duration_ms': 200000} for track_id in ids]}
+
+        sp = Spotify()
+        songs = [{'spotify_id': f'id{i}', 'title': 'Song', 'artist': 'Artist'} for i in range(120)]
+        songs.append({'spotify_id': '', 'title': 'Local file', 'artist': 'Artist'})
+        hydrate_songs(sp, songs)
+        self.assertEqual(sp.calls, [50, 50, 20])
+        self.assertEqual({song.get('duration_ms') for song in songs[:-1]}, {200000})
+        self.assertNotIn('duration_ms', songs[-1])
+
+
+class MatchCacheTests(TransferViewTestCase):
+    song = {'title': 'Song', 'artist': 'Artist'}
+
+    def test_fallback_matches_are_not_cached(self):
+        other = {'title': 'Other song', 'artist': 'Artist'}
+        self.assertEqual(store_matches([(self.song, 'vsong', 'song'), (other, 'vvideo', 'fallback')]), 1)
+        self.assertEqual(cached_matches([self.song, other]), {0: 'vsong'})
+
+    def test_warmer_does_not_cache_fallback_matches(self):
+        report = warm(['pl'], FakeSpotify({'pl': 3}), FakeYTMusic(result_type='video'), searches_per_second=0,
+                      log=lambda message: None)
+        self.assertEqual((report['searched'], report['resolved'], report['fallback']), (3, 0, 3))
+        self.assertEqual(report['coverage_after'], 0.0)
+        self.assertFalse(MatchCacheEntry.objects.exists())
+
+    def test_warmer_does_not_count_searches_rejected_by_the_breaker(self):
+        class YTMusic(FakeYTMusic):
+            def search(self, query, filter=None, limit=20):
+                if len(self.video_ids) == 3:
+                    raise CircuitOpenError('ytmusic', 30)
+                if len(self.video_ids) == 1 and 'failing' not in self.video_ids:
+                    self.video_ids['failing'] = 'x'
+                    raise ValueError('search failed')
+                return super().search(query, filter, limit)
+
+        report = warm(['pl'], FakeSpotify({'pl': 5}), YTMusic(), searches_per_second=0, log=lambda message: None)
+        self.assertEqual((report['searched'], report['resolved'], report['failed']), (3, 2, 1))
+        self.assertIn('temporarily unavailable', report['stopped_reason'])
+
+    def test_fallback_match_keeps_its_score_on_the_next_transfer(self):
+        self.ytmusic.result_type = 'video'
+        for _ in range(2):
+            self.assertEqual(self.post_transfer(playlist_identifier='pl12').status_code, 200)
+        self.assertFalse(MatchCacheEntry.objects.exists())
+        self.assertEqual(set(TrackResult.objects.values_list('strategy', 'score')), {('fallback', 0.5)})
+
+
+class ClaimTests(TestCase):
+    def setUp(self):
+        self.transfer = Transfer.objects.create(spotify_playlist_id='pl', track_count=2)
+        jobs.enqueue([
+            jobs._unit(self.transfer, WorkUnit.KIND_SEARCH_BATCH, seq=0),
+            jobs._unit(self.transfer, WorkUnit.KIND_SEARCH_BATCH, seq=1),
+        ])
+
+    def test_leased_unit_is_not_claimed_again(self):
+        first = jobs.claim('worker-a')
+        second = jobs.claim('worker-b')
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertIsNone(jobs.claim('worker-c'))
+
+    def test_unit_taken_after_it_was_listed_is_skipped(self):
+        # worker-b lists both units as candidates, then worker-a leases the
+        # first before worker-b's conditional update runs
+        values_list = QuerySet.values_list
+        taken = []
+
+        def listed_then_taken(queryset, *args, **kwargs):
+            candidates = list(values_list(queryset, *args, **kwargs))
+            with mock.patch.object(QuerySet, 'values_list', values_list):
+                taken.append(jobs.claim('worker-a'))
+            return candidates
+
+        with mock.patch.object(QuerySet, 'values_list', listed_then_taken):
+            unit = jobs.claim('worker-b')
+        self.assertEqual(taken[0].seq, 0)
+        self.assertEqual(unit.seq, 1)
+        self.assertEqual(unit.lease_owner, 'worker-b')
+        self.assertEqual(WorkUnit.objects.get(pk=taken[0].pk).lease_owner, 'worker-a')
+
+    def test_transfers_take_turns(self):
+        # A second, later transfer doesn't wait for the first one's backlog
+        other = Transfer.objects.create(spotify_playlist_id='other', track_count=2)
+        jobs.enqueue([jobs._unit(self.transfer, WorkUnit.KIND_SEARCH_BATCH, seq=seq) for seq in range(2, 5)])
+        jobs.enqueue([jobs._unit(other, WorkUnit.KIND_SEARCH_BATCH, seq=seq) for seq in range(2)])
+        claimed = [jobs.claim(f'worker-{i}') for i in range(7)]
+        self.assertEqual([(unit.transfer_id == other.pk, unit.seq) for unit in claimed],
+                         [(False, 0), (True, 0), (False, 1), (True, 1), (False, 2), (False, 3), (False, 4)])
+
+    def test_least_recently_served_transfer_goes_first(self):
+        other = Transfer.objects.create(spotify_playlist_id='other', track_count=2)
+        jobs.enqueue([jobs._unit(other, WorkUnit.KIND_SEARCH_BATCH, seq=0)])
+        # self.transfer had a unit running a minute ago, `other` ten minutes ago
+        WorkUnit.objects.filter(transfer=self.transfer, seq=1).update(
+            state=WorkUnit.STATE_DONE, heartbeat_at=timezone.now() - timedelta(minutes=1))
+        jobs.enqueue([jobs._unit(other, WorkUnit.KIND_SEARCH_BATCH, seq=9)])
+        WorkUnit.objects.filter(transfer=other, seq=9).update(
+            state=WorkUnit.STATE_DONE, heartbeat_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(jobs.claim('worker-a').transfer_id, other.pk)
+        self.assertEqual(jobs.claim('worker-b').transfer_id, self.transfer.pk)
+
+    def test_expired_lease_is_claimed_by_another_worker(self):
+        unit = jobs.claim('worker-a', lease_seconds=30)
+        self.assertEqual(unit.attempts, 1)
+        WorkUnit.objects.filter(pk=unit.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        WorkUnit.objects.exclude(pk=unit.pk).update(state=WorkUnit.STATE_DONE)
+        reclaimed = jobs.claim('worker-b', lease_seconds=30)
+        self.assertEqual(reclaimed.pk, unit.pk)
+        self.assertEqual(reclaimed.lease_owner, 'worker-b')
+        self.assertEqual(reclaimed.attempts, 2)
+
+    def test_complete_after_lease_lost_raises(self):
+        unit = jobs.claim('worker-a', lease_seconds=30)
+        WorkUnit.objects.filter(pk=unit.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        WorkUnit.objects.exclude(pk=unit.pk).update(state=WorkUnit.STATE_DONE)
+        jobs.claim('worker-b', lease_seconds=30)
+        with self.assertRaises(jobs.LeaseLost):
+            jobs.Lease(unit, 'worker-a').complete()
+        unit.refresh_from_db()
+        self.assertEqual(unit.state, WorkUnit.STATE_LEASED)
+        self.assertEqual(unit.lease_owner, 'worker-b')
+
+    def test_released_pause_does_not_count_an_attempt(self):
+        unit = jobs.claim('worker-a')
+        jobs.Lease(unit, 'worker-a').release(delay=0, error='paused', count_attempt=False)
+        unit.refresh_from_db()
+        self.assertEqual(unit.state, WorkUnit.STATE_PENDING)
+        self.assertEqual(unit.attempts, 0)
+
+
+class BackgroundTransferTests(TestCase):
+    def create_transfer(self, statuses, **kwargs):
+        transfer = Transfer.objects.create(spotify_playlist_id='pl', track_count=len(statuses),
+                                           ytmusic_token={}, **kwargs)
+        # Inserted last position first, so nothing depends on row order
+        TrackResult.objects.bulk_create([
+            TrackResult(transfer=transfer, position=position, title=f'Song {position}',
+                        video_id=f'v{position}' if status == TrackResult.STATUS_MATCHED else '', status=status)
+            for position, status in reversed(list(enumerate(statuses)))
+        ])
+        return transfer
+
+    def test_write_batches_add_tracks_in_playlist_order(self):
+        transfer = self.create_transfer([TrackResult.STATUS_MATCHED] * 250, yt_playlist_id='PLtest')
+        jobs.enqueue([jobs._unit(transfer, WorkUnit.KIND_WRITE_BATCH)])
+        ytmusic = FakeYTMusic()
+        run_units(ytmusic)
+        self.assertEqual([len(add) for add in ytmusic.adds], [100, 100, 50])
+        self.assertEqual(sum(ytmusic.adds, []), [f'v{position}' for position in range(250)])
+        transfer.refresh_from_db()
+        self.assertEqual(transfer.status, Transfer.STATUS_COMPLETED)
+        self.assertEqual(transfer.found_count, 250)
+
+    def test_repeated_video_is_added_once(self):
+        transfer = self.create_transfer([TrackResult.STATUS_MATCHED] * 3, yt_playlist_id='PLtest')
+        TrackResult.objects.filter(transfer=transfer, position=2).update(video_id='v0')
+        jobs.enqueue([jobs._unit(transfer, WorkUnit.KIND_WRITE_BATCH)])
+        ytmusic = FakeYTMusic()
+        run_units(ytmusic)
+        self.assertEqual(ytmusic.adds, [['v0', 'v1']])
+        self.assertFalse(transfer.track_results.exclude(status=TrackResult.STATUS_ADDED).exists())
+
+    def test_retried_write_skips_videos_already_in_playlist(self):
+        transfer = self.create_transfer([TrackResult.STATUS_MATCHED] * 3, yt_playlist_id='PLtest')
+        jobs.enqueue([jobs._unit(transfer, WorkUnit.KIND_WRITE_BATCH)])
+        # An earlier attempt added the first two and died before recording them
+        WorkUnit.objects.filter(transfer=transfer).update(attempts=1)
+        ytmusic = FakeYTMusic()
+        ytmusic.adds.append(['v0', 'v1'])
+        run_units(ytmusic)
+        self.assertEqual(ytmusic.adds, [['v0', 'v1'], ['v2']])
+        self.assertFalse(transfer.track_results.exclude(status=TrackResult.STATUS_ADDED).exists())
+
+    @override_settings(TRANSFER_BACKGROUND_DEADLINE_SECONDS=60)
+    def test_expired_transfer_finishes_partial(self):
+        transfer = self.create_transfer([TrackResult.STATUS_MATCHED, TrackResult.STATUS_PENDING,
+                                         TrackResult.STATUS_PENDING])
+        Transfer.objects.filter(pk=transfer.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        jobs.enqueue([jobs._unit(transfer, WorkUnit.KIND_SEARCH_BATCH, payload={'start': 0, 'end': 3})])
+        ytmusic = FakeYTMusic()
+        run_units(ytmusic)
+        self.assertEqual(ytmusic.adds, [['v0']])
+        search = WorkUnit.objects.get(transfer=transfer, kind=WorkUnit.KIND_SEARCH_BATCH)
+        self.assertEqual(search.state, WorkUnit.STATE_DONE)
+        transfer.refresh_from_db()
+        self.assertEqual(transfer.status, Transfer.STATUS_PARTIAL)
+        self.assertEqual(transfer.found_count, 1)
+        self.assertIsNone(transfer.ytmusic_token)
+
+
+class ClientError(Exception):
+    http_status = 404
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('test', failure_rate=0.5, slow_call_seconds=5.0, min_calls=4,
+                                      window_seconds=60.0, open_seconds=30.0, clock=self.clock)
+
+    def trip(self):
+        for failed in (False, True, False, True):
+            self.breaker.before_call()
+            self.breaker.record(failed, 0.1)
+
+    def test_opens_then_half_opens_then_closes(self):
+        self.trip()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 30.0)
+        self.clock.advance(10)
+        self.assertEqual(self.breaker.retry_after(), 20.0)
+        self.clock.advance(20)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.before_call()
+        # Only one probe at a time
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.stats()['rejected_calls'], 2)
+
+    def test_failed_probe_opens_again(self):
+        self.trip()
+        self.clock.advance(30)
+        self.breaker.before_call()
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.retry_after(), 30.0)
+        self.assertEqual(self.breaker.times_opened, 2)
+
+    def test_stays_closed_below_failure_rate_or_min_calls(self):
+        for failed in (True, True, True):
+            self.breaker.record(failed, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        # The old failures leave the window before the fourth call
+        self.clock.advance(61)
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.stats()['recent_calls'], 1)
+
+    def test_slow_calls_count_as_failures(self):
+        for elapsed in (0.1, 5.0, 0.1, 6.0):
+            self.breaker.record(False, elapsed)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_client_errors_are_not_failures(self):
+        def not_found():
+            raise ClientError('missing playlist')
+        for _ in range(4):
+            with self.assertRaises(ClientError):
+                self.breaker.call(not_found)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.stats()['recent_failures'], 0)
+
+
+class FairSchedulerTests(SimpleTestCase):
+    def submit(self, job, *labels):
+        for label in labels:
+            job.submit(str, label)
+
+    def take(self, scheduler, finish=True):
+        """Labels of the tasks in the order workers would start them.
+
+        The scheduler has no workers, so nothing runs; with `finish` each
+        task is counted as done as soon as it is taken.
+        """
+        taken = []
+        with scheduler._lock:
+            task, queue = scheduler._next_task()
+            while task is not None:
+                taken.append(task.args[0])
+                if finish:
+                    queue.running -= 1
+                task, queue = scheduler._next_task()
+        return taken
+
+    def test_users_are_interleaved_by_finish_tag(self):
+        scheduler = FairScheduler(workers=0, small_job_tracks=0)
+        self.submit(scheduler.job('a', size=100), 'a0', 'a1', 'a2')
+        self.submit(scheduler.job('b', size=100), 'b0', 'b1', 'b2')
+        self.assertEqual(self.take(scheduler), ['a0', 'b0', 'a1', 'b1', 'a2', 'b2'])
+
+    def test_heavier_job_gets_a_bigger_share(self):
+        scheduler = FairScheduler(workers=0, small_job_tracks=0)
+        self.submit(scheduler.job('a', size=100, weight=2.0), 'a0', 'a1', 'a2', 'a3')
+        self.submit(scheduler.job('b', size=100), 'b0', 'b1')
+        self.assertEqual(self.take(scheduler), ['a0', 'a1', 'b0', 'a2', 'a3', 'b1'])
+
+    def test_fast_lane_is_served_first(self):
+        scheduler = FairScheduler(workers=0, small_job_tracks=10)
+        self.submit(scheduler.job('a', size=100), 'a0', 'a1')
+        self.submit(scheduler.job('b', size=10), 'b0', 'b1')
+        self.assertEqual(self.take(scheduler), ['b0', 'b1', 'a0', 'a1'])
+
+    def test_per_user_concurrency_is_capped(self):
+        scheduler = FairScheduler(workers=0, per_user_concurrency=2, small_job_tracks=10)
+        self.submit(scheduler.job('a', size=100), 'a0', 'a1', 'a2')
+        # The cap covers both lanes
+        self.submit(scheduler.job('a', size=5), 'a-small')
+        self.submit(scheduler.job('b', size=100), 'b0')
+        self.assertEqual(self.take(scheduler, finish=False), ['a-small', 'a0', 'b0'])
+
+    def test_running_tasks_are_capped_per_user(self):
+        scheduler = FairScheduler(workers=4, per_user_concurrency=2)
+        release = threading.Event()
+        started = threading.Semaphore(0)
+
+        def blocked():
+            started.release()
+            release.wait(5)
+
+        job = scheduler.job('a', size=100)
+        futures = [job.submit(blocked) for _ in range(4)]
+        for _ in range(2):
+            self.assertTrue(started.acquire(timeout=5))
+        self.assertEqual(scheduler.stats()['running_tasks'], 2)
+        self.assertEqual(scheduler.stats()['queued_tasks'], 2)
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+
+    def test_cancelled_task_is_skipped(self):
+        scheduler = FairScheduler(workers=1)
+        release = threading.Event()
+        ran = []
+        job = scheduler.job('a', size=100)
+        first = job.submit(release.wait, 5)
+        cancelled = job.submit(ran.append, 'cancelled')
+        last = job.submit(ran.append, 'last')
+        self.assertTrue(cancelled.cancel())
+        release.set()
+        last.result(timeout=5)
+        self.assertTrue(first.result(timeout=5))
+        self.assertEqual(ran, ['last'])
+
+
+class HedgerTests(SimpleTestCase):
+    def primed(self, **kwargs):
+        """A hedger whose recent calls all took 10 ms."""
+        hedger = Hedger(min_delay=0.01, min_samples=20, max_workers=4, **kwargs)
+        # Enough samples that this test's own calls don't move the 95th percentile
+        for _ in range(400):
+            hedger.latencies.add(0.01)
+        return hedger
+
+    def test_no_hedge_before_min_samples(self):
+        hedger = Hedger(min_delay=0.01, min_samples=20, max_workers=4)
+        calls = itertools.count()
+
+        def slow():
+            next(calls)
+            time.sleep(0.05)
+            return 'primary'
+
+        self.assertEqual(hedger.call(slow), 'primary')
+        self.assertEqual(next(calls), 1)
+        self.assertEqual(hedger.hedges_issued, 0)
+
+    def test_slow_call_is_hedged_and_hedge_wins(self):
+        hedger = self.primed()
+        release = threading.Event()
+        calls = itertools.count()
+
+        def first_stuck():
+            if next(calls) == 0:
+                release.wait(5)
+                return 'primary'
+            return 'hedge'
+
+        try:
+            self.assertEqual(hedger.call(first_stuck), 'hedge')
+        finally:
+            release.set()
+        self.assertEqual((hedger.hedges_issued, hedger.hedges_won), (1, 1))
+
+    def test_fast_call_is_not_hedged(self):
+        hedger = self.primed()
+        self.assertEqual(hedger.call(str, 'x'), 'x')
+        self.assertEqual(hedger.hedges_issued, 0)
+
+    def test_budget_limits_hedges(self):
+        hedger = self.primed(budget_ratio=0.25)
+
+        def slow():
+            time.sleep(0.05)
+            return 'ok'
+
+        for _ in range(8):
+            hedger.call(slow)
+        # The budget starts with one hedge, then earns a quarter of one per call
+        self.assertEqual(hedger.hedges_issued, 3)
+        self.assertEqual(hedger.hedges_skipped_budget, 5)
+
+    def test_error_only_when_both_calls_fail(self):
+        hedger = self.primed(budget_ratio=1.0)
+        calls = itertools.count()
+
+        def primary_fails():
+            if next(calls) % 2 == 0:
+                time.sleep(0.03)
+                raise ValueError('primary')
+            time.sleep(0.06)
+            return 'hedge'
+
+        self.assertEqual(hedger.call(primary_fails), 'hedge')
+
+        def both_fail():
+            time.sleep(0.03)
+            raise ValueError('failed')
+
+        with self.assertRaises(ValueError):
+            hedger.call(both_fail)
+        self.assertEqual(hedger.hedges_issued, 2)
+
+
+class SnapshotTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'match_snapshot.bin')
+
+    def test_round_trip(self):
+        self.assertEqual(snapshot.write_snapshot(self.path, [(5, 'vfive'), (-3, 'vminus'), (2 ** 62, 'v' * 16)],
+                                                 built_at=1234.5), 3)
+        loaded = snapshot.MatchSnapshot(self.path)
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded.built_at, 1234.5)
+        self.assertEqual([loaded.get(key) for key in (-3, 5, 2 ** 62)], ['vminus', 'vfive', 'v' * 16])
+        self.assertIsNone(loaded.get(4))
+        self.assertIsNone(loaded.get(2 ** 63 - 1))
+
+    def test_empty_snapshot(self):
+        self.assertEqual(snapshot.write_snapshot(self.path, []), 0)
+        loaded = snapshot.MatchSnapshot(self.path)
+        self.assertEqual(len(loaded), 0)
+        self.assertIsNone(loaded.get(1))
+
+    def test_truncated_or_foreign_files_are_rejected(self):
+        snapshot.write_snapshot(self.path, [(1, 'vone'), (2, 'vtwo')])
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 4)
+        for content in (None, b'S2YMATCH', b'not a match snapshot, but long enough to have a header'):
+            if content is not None:
+                with open(self.path, 'wb') as f:
+                    f.write(content)
+            with self.assertRaises(ValueError):
+                snapshot.MatchSnapshot(self.path)
+
+    def test_reader_switches_to_replaced_file(self):
+        snapshot.write_snapshot(self.path, [(1, 'vold')])
+        reader = snapshot.SnapshotReader(self.path, check_seconds=0)
+        old = reader.current()
+        self.assertEqual(old.get(1), 'vold')
+        snapshot.write_snapshot(self.path, [(1, 'vnew')])
+        self.assertEqual(reader.current().get(1), 'vnew')
+        # Lookups already holding the old mapping keep working
+        self.assertEqual(old.get(1), 'vold')
+        # A broken replacement is ignored, a removed file is not
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write(b'broken')
+        os.replace(self.path + '.tmp', self.path)
+        self.assertEqual(reader.current().get(1), 'vnew')
+        os.unlink(self.path)
+        self.assertIsNone(reader.current())
+
+    def test_stale_snapshot_is_ignored(self):
+        snapshot.write_snapshot(self.path, [(1, 'vone')], built_at=time.time() - 7200)
+        for max_age, stale in ((3600, True), (3 * 3600, False), (0, False)):
+            with override_settings(MATCH_SNAPSHOT_PATH=self.path, MATCH_SNAPSHOT_MAX_AGE_SECONDS=max_age), \
+                    mock.patch.object(snapshot, '_reader', None):
+                self.assertEqual(snapshot.current_snapshot() is None, stale)
+                self.assertEqual(snapshot.snapshot_stats()['stale'], stale)
+
+
+class MetricsTests(TestCase):
+    def test_snapshot_path_is_not_shown(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'match_snapshot.bin')
+        snapshot.write_snapshot(path, [(1, 'vone')])
+        with override_settings(MATCH_SNAPSHOT_PATH=path, MATCH_SNAPSHOT_MAX_AGE_SECONDS=3600), \
+                mock.patch.object(snapshot, '_reader', None):
+            stats = self.client.get(reverse('metrics')).json()['match_snapshot']
+        self.assertEqual(stats['entries'], 1)
+        self.assertFalse(stats['stale'])
+        self.assertNotIn(directory.name, json.dumps(stats))
+
+
+class TransferReportTests(TestCase):
+    def setUp(self):
+        self.transfer = Transfer.objects.create(spotify_playlist_id='pl', track_count=5)
+        TrackResult.objects.bulk_create([
+            TrackResult(transfer=self.transfer, position=position, spotify_id=f'id{position}', title=f'Song {position}',
+                        artist='Artist', video_id=f'v{position}' if position != 3 else '',
+                        score=0.9 if position != 3 else None, strategy='song' if position != 3 else '',
+                        status=TrackResult.STATUS_ADDED if position != 3 else TrackResult.STATUS_NOT_FOUND)
+            for position in range(5)
+        ])
+        self.url = reverse('transfer_report', args=[self.transfer.public_id])
+
+    def positions(self, rows):
+        return [row['position'] for row in rows]
+
+    def test_pages(self):
+        rows, cursor = reports.page(self.transfer, limit=2)
+        self.assertEqual((self.positions(rows), cursor), ([0, 1], 1))
+        rows, cursor = reports.page(self.transfer, after=1, limit=2)
+        self.assertEqual((self.positions(rows), cursor), ([2, 3], 3))
+        rows, cursor = reports.page(self.transfer, after=3, limit=2)
+        self.assertEqual((self.positions(rows), cursor), ([4], None))
+        # Exactly `limit` rows left: no next page
+        rows, cursor = reports.page(self.transfer, limit=5)
+        self.assertEqual((self.positions(rows), cursor), ([0, 1, 2, 3, 4], None))
+
+    def test_ndjson_with_next_page_headers(self):
+        response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['X-Next-Cursor'], '1')
+        self.assertIn('cursor=1', response['Link'])
+        self.assertIn('limit=2', response['Link'])
+        self.assertTrue(response['Link'].endswith('; rel="next"'))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows[0], {
+            'position': 0, 'spotify_id': 'id0', 'spotify_url': 'https://open.spotify.com/track/id0',
+            'title': 'Song 0', 'artist': 'Artist', 'video_id': 'v0',
+            'youtube_url': 'https://music.youtube.com/watch?v=v0', 'score': 0.9, 'strategy': 'song',
+            'status': 'added',
+        })
+        self.assertEqual(self.positions(rows), [0, 1])
+
+        response = self.client.get(self.url, {'limit': 2, 'cursor': 3})
+        self.assertNotIn('X-Next-Cursor', response)
+        self.assertNotIn('Link', response)
+
+    def test_csv(self):
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(reports.COLUMNS))
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[4], '3,id3,https://open.spotify.com/track/id3,Song 3,Artist,,,,,not_found')
+
+    def test_bad_parameters(self):
+        for params in ({'limit': 'ten'}, {'limit': 0}, {'cursor': 'x'}, {'format': 'xml'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+        missing = reverse('transfer_report', args=['00000000-0000-0000-0000-000000000000'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class MatchScoreTests(SimpleTestCase):
+    song = {'title': 'Song', 'artist': 'Artist', 'duration_ms': 200000}
+
+    def test_score(self):
+        self.assertEqual(match_score(0, {'duration_seconds': 205}, self.song), 1.0)
+        self.assertEqual(match_score(2, {'duration_seconds': 205}, self.song), 0.8)
+        # 40 seconds off is 30 past the tolerance
+        self.assertEqual(match_score(0, {'duration_seconds': 240}, self.song), 0.5)
+        self.assertEqual(match_score(0, {}, self.song), 0.8)
+        self.assertEqual(match_score(0, {'duration_seconds': 200}, self.song, fallback=True), 0.5)
+
+    def test_search_prefers_a_song_of_the_same_length(self):
+        class YTMusic:
+            def search(self, query, filter=None, limit=20):
+                return [
+                    {'resultType': 'song', 'videoId': 'vlive', 'duration_seconds': 400},
+                    {'resultType': 'song', 'videoId': 'vstudio', 'duration_seconds': 201},
+                ]
+
+        self.assertEqual(search_song(YTMusic(), self.song), ('vstudio', 'song', 0.9))
+
+
+class ProviderQuotaTests(SimpleTestCase):
+    def test_calls_leave_the_window(self):
+        clock = FakeClock()
+        quota = ProviderQuota('test', limit=3, window_seconds=60.0, clock=clock)
+        for _ in range(3):
+            quota.record()
+            clock.advance(10)
+        self.assertEqual(quota.remaining(), 0)
+        self.assertEqual(quota.seconds_until_available(1), 30.0)
+        self.assertEqual(quota.seconds_until_available(2), 40.0)
+        clock.advance(30)
+        self.assertEqual(quota.used(), 2)
+        self.assertEqual(quota.remaining(), 1)
+        self.assertEqual(quota.seconds_until_available(1), 0.0)
+
+    def test_unlimited(self):
+        quota = ProviderQuota('test', clock=FakeClock())
+        quota.record()
+        self.assertIsNone(quota.remaining())
+        self.assertEqual(quota.seconds_until_available(1000), 0.0)
+
+
+class AdmissionControllerTests(TestCase):
+    def controller(self, **limits):
+        limits = {'max_inflight_tracks': 100, 'max_background_tracks': 1000, 'max_per_user': 2, 'retry_after': 30,
+                  **limits}
+        return AdmissionController(**limits)
+
+    def assertRejected(self, admit, reason, status, retry_after=30):
+        with self.assertRaises(AdmissionRejected) as raised:
+            admit()
+        self.assertEqual((raised.exception.reason, raised.exception.status, raised.exception.retry_after),
+                         (reason, status, retry_after))
+
+    def test_per_user_cap_is_429(self):
+        controller = self.controller()
+        first = controller.admit('u', 10)
+        controller.admit('u', 10)
+        self.assertRejected(lambda: controller.admit('u', 10), 'per_user', 429)
+        controller.admit('other', 10)
+        first.release()
+        controller.admit('u', 10)
+
+    def test_per_user_cap_counts_background_transfers(self):
+        transfer = Transfer.objects.create(spotify_user_id='u', spotify_playlist_id='pl')
+        jobs.start_background_transfer(transfer, 10)
+        controller = self.controller(max_per_user=1)
+        self.assertRejected(lambda: controller.admit('u', 10), 'per_user', 429)
+        WorkUnit.objects.update(state=WorkUnit.STATE_DONE)
+        controller.admit('u', 10)
+
+    def test_inflight_tracks_limit_is_503(self):
+        controller = self.controller()
+        ticket = controller.admit('a', 80)
+        self.assertRejected(lambda: controller.admit('b', 30), 'inflight_tracks', 503)
+        controller.admit('b', 20)
+        self.assertRejected(controller.precheck, 'inflight_tracks', 503)
+        # Background transfers don't hold tracks in flight
+        controller.precheck(background=True)
+        ticket.release()
+        controller.admit('c', 10)
+
+    def test_transfer_over_the_limit_runs_alone(self):
+        controller = self.controller()
+        ticket = controller.admit('a', 150)
+        self.assertRejected(lambda: controller.admit('b', 10), 'inflight_tracks', 503)
+        ticket.release()
+        self.assertEqual(controller.stats()['inflight_tracks'], 0)
+
+    def test_background_backlog_limit_is_503(self):
+        transfer = Transfer.objects.create(spotify_user_id='other', spotify_playlist_id='pl')
+        # Nine pages of tracks to fetch
+        jobs.start_background_transfer(transfer, 900)
+        controller = self.controller()
+        self.assertRejected(lambda: controller.admit('u', 101, background=True), 'background_backlog', 503)
+        controller.admit('u', 100, background=True)
+
+    def test_ytmusic_quota_is_503_until_calls_leave_the_window(self):
+        clock = FakeClock()
+        quota = ProviderQuota('ytmusic', limit=10, clock=clock)
+        for _ in range(8):
+            quota.record()
+            clock.advance(1)
+        controller = self.controller()
+        with mock.patch.dict(admission._quotas, {'ytmusic': quota}):
+            # 5 searches and 2 playlist calls need the 5th oldest call to expire
+            self.assertRejected(lambda: controller.admit('u', 5), 'ytmusic_quota', 503, retry_after=56)
+            controller.admit('u', 0)
+            clock.advance(56)
+            controller.admit('u', 5)
+
+
+class AdmissionViewTests(TransferViewTestCase):
+    def test_rejected_transfer_gets_retry_after(self):
+        controller = AdmissionController(max_inflight_tracks=0, max_background_tracks=0, max_per_user=1,
+                                         retry_after=30)
+        controller.admit('user1', 10)
+        with mock.patch('api_v1.views.get_admission', return_value=controller):
+            response = self.post_transfer(playlist_identifier='pl12')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response.json()['reason'], 'per_user')
+        self.assertFalse(Transfer.objects.exists())
+
+
+class DeadlineTests(SimpleTestCase):
+    def test_expires(self):
+        clock = FakeClock()
+        deadline = Deadline(10, clock=clock)
+        clock.advance(4)
+        self.assertEqual(deadline.remaining(), 6)
+        deadline.check()
+        clock.advance(6)
+        self.assertTrue(deadline.expired())
+        with self.assertRaises(DeadlineExceeded):
+            deadline.check()
+
+    def test_nested_deadline_keeps_the_sooner_one(self):
+        self.assertIsNone(current_deadline())
+        with deadline(10) as outer:
+            with deadline(60) as inner:
+                self.assertIs(inner, outer)
+            with deadline(5) as inner:
+                self.assertLess(inner.remaining(), 5.01)
+            with deadline(None) as inner:
+                self.assertIs(inner, outer)
+        self.assertIsNone(current_deadline())
+
+    def test_call_timeout(self):
+        self.assertEqual(call_timeout(30), (30, False))
+        with deadline(10):
+            timeout, limited = call_timeout(30)
+            self.assertTrue(limited)
+            self.assertLessEqual(timeout, 10)
+            self.assertEqual(call_timeout(5), (5, False))
+            self.assertTrue(call_timeout(None)[1])
+        with deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                call_timeout(30)
+
+
+class DeadlineSessionTests(SimpleTestCase):
+    def setUp(self):
+        import requests
+        self.requests = requests
+        self.session = providers._deadline_session_class()()
+        patcher = mock.patch.object(requests.Session, 'request', return_value='response')
+        self.sent = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def timeout(self):
+        return self.sent.call_args.kwargs['timeout']
+
+    def test_timeout_is_capped_by_the_deadline(self):
+        self.session.default_timeout = 30
+        self.session.request('GET', 'https://example.com/')
+        self.assertEqual(self.timeout(), 30)
+        with deadline(5):
+            self.session.request('GET', 'https://example.com/')
+            self.assertLessEqual(self.timeout(), 5)
+            self.session.request('GET', 'https://example.com/', timeout=(3, 30))
+            connect, read = self.timeout()
+            self.assertEqual(connect, 3)
+            self.assertLessEqual(read, 5)
+
+    def test_timeout_set_by_the_deadline_raises_deadline_exceeded(self):
+        self.sent.side_effect = self.requests.Timeout('read timed out')
+        with deadline(5):
+            with self.assertRaises(DeadlineExceeded):
+                self.session.request('GET', 'https://example.com/', timeout=30)
+            # The request's own, shorter timeout is the provider's fault
+            with self.assertRaises(self.requests.Timeout) as raised:
+                self.session.request('GET', 'https://example.com/', timeout=1)
+            self.assertNotIsInstance(raised.exception, DeadlineExceeded)
+
+    def test_no_request_once_the_deadline_passed(self):
+        with deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                self.session.request('GET', 'https://example.com/', timeout=30)
+        self.sent.assert_not_called()
+
+
+class GuardedClientDeadlineTests(SimpleTestCase):
+    def test_call_is_not_started_after_the_deadline(self):
+        ytmusic = FakeYTMusic()
+        breaker = CircuitBreaker('test')
+        with mock.patch.object(providers, 'get_breaker', return_value=breaker), deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                providers.GuardedClient('ytmusic', ytmusic).search('song')
+        self.assertEqual(ytmusic.video_ids, {})
+        self.assertEqual(breaker.stats()['recent_calls'], 0)
+
+
+class RequestProfilingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(REQUEST_PROFILING_ENABLED=True, REQUEST_PROFILING_TOKEN='secret',
+                                              REQUEST_PROFILING_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.middleware = RequestProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+    def profile(self, mode, token='secret'):
+        request = RequestFactory().get('/api/v1/metrics/', HTTP_X_PROFILE=mode, HTTP_X_PROFILE_TOKEN=token)
+        response = self.middleware(request)
+        if 'X-Profile-Id' not in response:
+            return None
+        with open(os.path.join(self.directory, response['X-Profile-Id'] + '.json')) as f:
+            return json.load(f)['mode']
+
+    def test_sampling_is_the_default(self):
+        self.assertEqual(self.profile('1'), 'sample')
+        self.assertEqual(self.profile('sample'), 'sample')
+        self.assertEqual(self.profile('cprofile'), 'cprofile')
+
+    def test_token_is_required(self):
+        self.assertIsNone(self.profile('sample', token='wrong'))
+        self.assertEqual(os.listdir(self.directory), [])
@@ -0,0 +1,187 @@
+from concurrent.futures import Future
+import uuid
+
+from django.conf import settings
+
+from .hedging import get_hedger
+from .models import TrackResult
+
+
+# Helpers shared by the synchronous /transfer/ view and background jobs (api_v1.jobs)
+
+# Spotify track fields used for matching; request these in playlist `fields=`
+# filters so the playlist payload already carries them
+TRACK_FIELDS = 'id,name,artists(name),duration_ms'
+# Maximum number of IDs Spotify's several-tracks endpoint accepts
+TRACKS_PER_CALL = 50
+# A search result whose length differs by more than this is likely another
+# version (live, extended mix, ...) of the song
+DURATION_TOLERANCE_SECONDS = 10
+
+
+def parse_playlist_id(playlist_identifier):
+    """Extract a playlist ID from a Spotify playlist URL, URI or bare ID."""
+    playlist_id = playlist_identifier
+    if "open.spotify.com/playlist/" in playlist_identifier:
+        playlist_id = playlist_identifier.split("/")[-1].split("?")[0]
+    elif "spotify:playlist:" in playlist_identifier:
+        playlist_id = playlist_identifier.split(":")[-1]
+    return playlist_id
+
+
+def song_from_track(track):
+    """Song info dict for a Spotify track object, or None for empty/local-only items."""
+    if not track or not track.get('name'):
+        return None
+    artists = [artist['name'] for artist in track.get('artists') or []]
+    return {
+        'spotify_id': track.get('id') or '',
+        'title': track['name'],
+        'artist': ', '.join(artists),
+        # Kept apart: artist names can contain ", " themselves ("Tyler, The Creator")
+        'primary_artist': artists[0] if artists else '',
+        'spotify_url': track.get('external_urls', {}).get('spotify', ''),
+        'duration_ms': track.get('duration_ms'),
+    }
+
+
+def hydrate_songs(sp, songs):
+    """Fill in the duration of songs that lack it.
+
+    Looks the tracks up through the several-tracks endpoint, TRACKS_PER_CALL
+    IDs per call, so a 500 track playlist costs 10 calls rather than 500.
+    Songs without a Spotify ID (local files) are left as they are.
+    """
+    by_id = {}
+    for song in songs:
+        if song.get('spotify_id') and not song.get('duration_ms'):
+            by_id.setdefault(song['spotify_id'], []).append(song)
+    ids = list(by_id)
+    for start in range(0, len(ids), TRACKS_PER_CALL):
+        response = sp.tracks(ids[start:start + TRACKS_PER_CALL])
+        for track in response.get('tracks') or []:
+            if not track:
+                continue
+            for song in by_id.get(track.get('id'), []):
+                song['duration_ms'] = track.get('duration_ms')
+    return songs
+
+
+def completed_future(result):
+    """A Future that already holds `result`, to mix cached answers in with scheduled searches."""
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
+
+
+def stored_primary_artist(song):
+    """TrackResult.primary_artist for a song: blank when it is the only artist."""
+    primary = song.get('primary_artist') or ''
+    return '' if primary == song['artist'] else primary[:255]
+
+
+def track_result(position, song, status, video_id='', strategy='', score=None):
+    return TrackResult(
+        position=position,
+        spotify_id=song.get('spotify_id', ''),
+        title=song['title'][:255],
+        artist=song['artist'][:255],
+        primary_artist=stored_primary_artist(song),
+        video_id=video_id or '',
+        strategy=strategy,
+        score=score,
+        status=status,
+    )
+
+
+def match_score(rank, result, song, fallback=False):
+    """Confidence, from 0 to 1, that search result `result` is `song`.
+
+    The top search result scores 1.0 and each one below it 0.1 less. That
+    is scaled down the further its length is off by more than
+    DURATION_TOLERANCE_SECONDS, a little when either length is unknown,
+    and by half for a fallback that isn't a song at all.
+    """
+    score = max(0.1, 1.0 - 0.1 * rank)
+    seconds = song['duration_ms'] / 1000.0 if song.get('duration_ms') else None
+    if seconds is not None and result.get('duration_seconds') is not None:
+        excess = abs(result['duration_seconds'] - seconds) - DURATION_TOLERANCE_SECONDS
+        if excess > 0:
+            score *= max(0.2, 1.0 - excess / 60.0)
+    else:
+        score *= 0.8
+    if fallback:
+        score *= 0.5
+    return round(score, 2)
+
+
+def search_song(ytmusic, song):
+    """Search YouTube Music for a song, returning (video_id, strategy, score); see match_score()."""
+    query = f"{song['title']} {song['artist']}"
+    print(f"DEBUG: Searching for: {query}")
+    if settings.SEARCH_HEDGING_ENABLED:
+        # Re-issue the search if it is slower than recent ones; see api_v1.hedging
+        search_results = get_hedger().call(ytmusic.search, query, filter="songs", limit=5)
+    else:
+        search_results = ytmusic.search(query, filter="songs", limit=5)
+    
+    if search_results:
+        # Try to find the best match: the first song of about the same
+        # length, else the first song
+        songs = [(rank, result) for rank, result in enumerate(search_results)
+                 if result.get('resultType') == 'song' and result.get('videoId')]
+        if song.get('duration_ms'):
+            seconds = song['duration_ms'] / 1000.0
+            songs.sort(key=lambda ranked: ranked[1].get('duration_seconds') is None
+                       or abs(ranked[1]['duration_seconds'] - seconds) > DURATION_TOLERANCE_SECONDS)
+        if songs:
+            rank, result = songs[0]
+            print(f"DEBUG: Found match: {result.get('title')} - {result['videoId']}")
+            return result['videoId'], 'song', match_score(rank, result, song)
+        
+        # Fallback to first result if no song type found
+        if search_results[0].get('videoId'):
+            print(f"DEBUG: Using fallback match: {search_results[0].get('title')} - {search_results[0]['videoId']}")
+            return search_results[0]['videoId'], 'fallback', match_score(0, search_results[0], song, fallback=True)
+    
+    return None, '', None
+
+
+class PlaylistWriteError(Exception):
+    """YouTube Music answered add_playlist_items without adding the tracks."""
+
+
+def add_to_playlist(ytmusic, playlist_id, video_ids):
+    """Add videos to a playlist, raising PlaylistWriteError unless YouTube Music reports success.
+
+    ytmusicapi returns a rejected add (e.g. one containing a video the
+    playlist already has) rather than raising.
+    """
+    result = ytmusic.add_playlist_items(playlist_id, video_ids)
+    status = result.get('status', '') if isinstance(result, dict) else ''
+    if 'SUCCEEDED' not in status:
+        raise PlaylistWriteError(f"YouTube Music did not add {len(video_ids)} tracks to playlist {playlist_id}: "
+                                 f"{status or result}")
+    return result
+
+
+def playlist_video_ids(ytmusic, playlist_id):
+    """Videos already in a YouTube Music playlist."""
+    playlist = ytmusic.get_playlist(playlist_id, limit=None)
+    return {track['videoId'] for track in playlist.get('tracks') or [] if track.get('videoId')}
+
+
+def finish_transfer(transfer, status, found_count, not_found_count, yt_playlist_id=''):
+    transfer.status = status
+    transfer.found_count = found_count
+    transfer.not_found_count = not_found_count
+    transfer.yt_playlist_id = yt_playlist_id or ''
+    transfer.save(update_fields=['status', 'found_count', 'not_found_count', 'yt_playlist_id', 'updated_at'])
@@ -7,4 +7,7 @@ urlpatterns = [
     path('ytmusic/authorize/', views.ytmusic_authorize, name='ytmusic_authorize'),
     path('ytmusic/callback/', views.ytmusic_callback, name='ytmusic_callback'),
     path('transfer/', views.transfer_playlist, name='transfer_playlist'),
+    path('transfers/<uuid:public_id>/', views.transfer_status, name='transfer_status'),
+    path('transfers/<uuid:public_id>/report/', views.transfer_report, name='transfer_report'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
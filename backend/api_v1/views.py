@@ -1,26 +1,40 @@
 from django.shortcuts import redirect, render
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseServerError
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseServerError, StreamingHttpResponse
 from django.urls import reverse
 from django.conf import settings
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from ytmusicapi import YTMusic, OAuthCredentials
+from django.db import transaction as db_transaction
 import json
 import base64
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import math
 import os
 import time
 from datetime import datetime
 
-# For Google OAuth Web Flow
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials as GoogleCredentials
-from google.auth.transport.requests import Request as GoogleAuthRequest
+from . import jobs, providers, reports
+from .admission import AdmissionRejected, get_admission, releases_admission
+from .breakers import CircuitOpenError, all_breakers, get_breaker
+from .deadlines import DeadlineExceeded, deadline, search_budget, within_deadline
+from .hedging import hedging_stats
+from .matching import CACHED_STRATEGIES, cached_matches, store_matches
+from .models import Transfer, TrackResult
+from .persistence import TrackResultWriter
+from .scheduler import get_scheduler
+from .snapshot import snapshot_stats
+from .transfers import (
+    TRACK_FIELDS, PlaylistWriteError, add_to_playlist, completed_future, finish_transfer, is_uuid, parse_playlist_id,
+    search_song, song_from_track, track_result,
+)
+
+
+# The playlist endpoint returns at most this many tracks with the playlist
+# itself, and a synchronous transfer reads no further
+SYNC_TRACK_LIMIT = 100
 
 
 # --- Spotify Authentication ---
-SPOTIFY_SCOPE = "playlist-read-private playlist-read-collaborative"
 
 def get_spotify_oauth(request):
     # Construct the redirect_uri dynamically using Django's reverse
@@ -28,12 +42,7 @@ def get_spotify_oauth(request):
     redirect_uri = request.build_absolute_uri(reverse('spotify_callback'))
     print(f"DEBUG: Spotify OAuth redirect_uri being used: {redirect_uri}") # <<< ADD THIS LINE
     
-    return SpotifyOAuth(
-        client_id=settings.SPOTIPY_CLIENT_ID,
-        client_secret=settings.SPOTIPY_CLIENT_SECRET,
-        redirect_uri=redirect_uri,
-        scope=SPOTIFY_SCOPE,
-    )
+    return providers.spotify_oauth(redirect_uri)
 
 @require_http_methods(["GET"])
 def spotify_authorize(request):
@@ -91,21 +100,8 @@ def ytmusic_authorize(request):
     """Initiate YouTube Music OAuth flow."""
     print("DEBUG: ytmusic_authorize view hit")
     
-    # Create Google OAuth flow
-    flow = Flow.from_client_config(
-        {
-            "web": {
-                "client_id": settings.YTM_CLIENT_ID,
-                "client_secret": settings.YTM_CLIENT_SECRET,
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
-            }
-        },
-        scopes=["https://www.googleapis.com/auth/youtube"]
-    )
-    
-    # Set the redirect URI to our callback
-    flow.redirect_uri = request.build_absolute_uri(reverse('ytmusic_callback'))
+    # Create Google OAuth flow, redirecting to our callback
+    flow = providers.ytmusic_flow(request.build_absolute_uri(reverse('ytmusic_callback')))
     print(f"DEBUG: YouTube Music OAuth redirect_uri: {flow.redirect_uri}")
     
     # Get the authorization URL
@@ -140,18 +136,7 @@ def ytmusic_callback(request):
         print("DEBUG: Attempting to get YouTube Music access token...")
         
         # Create flow instance (same as in ytmusic_authorize)
-        flow = Flow.from_client_config(
-            {
-                "web": {
-                    "client_id": settings.YTM_CLIENT_ID,
-                    "client_secret": settings.YTM_CLIENT_SECRET,
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                }
-            },
-            scopes=["https://www.googleapis.com/auth/youtube"]
-        )
-        flow.redirect_uri = request.build_absolute_uri(reverse('ytmusic_callback'))
+        flow = providers.ytmusic_flow(request.build_absolute_uri(reverse('ytmusic_callback')))
         
         # Exchange code for token
         flow.fetch_token(code=code)
@@ -184,8 +169,112 @@ def ytmusic_callback(request):
 
 
 # --- Transfer Logic ---
+
+def _provider_unavailable(error, transfer=None):
+    """503 for a provider whose circuit breaker is open; the client should retry later."""
+    retry_after = max(1, math.ceil(error.retry_after))
+    response_data = {
+        'error': f'{error.provider} is temporarily unavailable. Please try again later.',
+        'provider': error.provider,
+        'retryable': True,
+        'retry_after': retry_after,
+    }
+    if transfer is not None:
+        # Resume by POSTing again with this transfer_id
+        response_data['transfer_id'] = str(transfer.public_id)
+        response_data['status'] = transfer.status
+        response_data['songs_processed_count'] = transfer.found_count + transfer.not_found_count
+    response = JsonResponse(response_data, status=503)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def _admission_rejected(error):
+    """429/503 for a transfer turned away by admission control; the client should retry later."""
+    response = JsonResponse({
+        'error': str(error),
+        'reason': error.reason,
+        'retryable': True,
+        'retry_after': error.retry_after,
+    }, status=error.status)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def _timed_out(provider):
+    """504 for a request whose deadline ran out before its transfer started."""
+    return JsonResponse({
+        'error': f'Timed out waiting for {provider}. Please try again.',
+        'retryable': True,
+    }, status=504)
+
+
+def _out_of_time(transfer, song_count, found_count, not_found_count, added_count=0, playlist_id=''):
+    """504 for a transfer whose deadline ran out; it is paused and can be resumed."""
+    finish_transfer(transfer, Transfer.STATUS_PAUSED, found_count, not_found_count,
+                    yt_playlist_id=playlist_id or transfer.yt_playlist_id)
+    retry_after = settings.TRANSFER_ADMISSION_RETRY_AFTER
+    response = JsonResponse({
+        'error': 'The transfer ran out of time. POST again with this transfer_id to continue.',
+        'retryable': True,
+        'retry_after': retry_after,
+        **_transfer_account(transfer, song_count, found_count, not_found_count, added_count),
+    }, status=504)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def _transfer_account(transfer, song_count, found_count, not_found_count, added_count):
+    """What a transfer cut off by its deadline has done so far."""
+    return {
+        'transfer_id': str(transfer.public_id),
+        'status': transfer.status,
+        'deadline_exceeded': True,
+        'playlist_id': transfer.yt_playlist_id or None,
+        'spotify_track_count': song_count,
+        'songs_processed_count': found_count + not_found_count,
+        'songs_found_count': found_count,
+        'songs_not_found_count': not_found_count,
+        'songs_added_count': added_count,
+        'songs_remaining_count': song_count - found_count - not_found_count,
+    }
+
+
+def _queue_background_transfer(request, spotify_user, playlist_id, spotify_playlist, yt_playlist_name,
+                               spotify_token_info, ytmusic_token_info):
+    """Create a transfer to be run by `manage.py run_transfer_worker` and return 202."""
+    spotify_playlist_name = spotify_playlist.get('name', 'Unknown Playlist')
+    track_total = spotify_playlist.get('tracks', {}).get('total', 0)
+    if not track_total:
+        return JsonResponse({'error': 'No tracks found in the Spotify playlist'}, status=400)
+    
+    with db_transaction.atomic():
+        transfer = Transfer.objects.create(
+            spotify_user_id=spotify_user.get('id', '') if spotify_user else '',
+            spotify_playlist_id=playlist_id,
+            spotify_playlist_name=spotify_playlist_name[:255],
+            yt_playlist_name=(yt_playlist_name or f"{spotify_playlist_name} (from Spotify)")[:255],
+            track_count=track_total,
+            spotify_token=spotify_token_info,
+            ytmusic_token=ytmusic_token_info,
+        )
+        jobs.start_background_transfer(transfer, track_total)
+    print(f"DEBUG: Queued background transfer {transfer.public_id} ({track_total} tracks)")
+    
+    return JsonResponse({
+        'message': 'Transfer queued',
+        'transfer_id': str(transfer.public_id),
+        'status': transfer.status,
+        'spotify_track_count': track_total,
+        'status_url': request.build_absolute_uri(reverse('transfer_status', args=[transfer.public_id])),
+        'report_url': request.build_absolute_uri(reverse('transfer_report', args=[transfer.public_id])),
+    }, status=202)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
+@releases_admission
+@within_deadline('TRANSFER_DEADLINE_SECONDS')
 def transfer_playlist(request):
     print(f"DEBUG: /transfer/ view hit")
     
@@ -196,6 +285,8 @@ def transfer_playlist(request):
         ytmusic_token_info = body.get('ytmusic_token')
         playlist_identifier = body.get('playlist_identifier')
         yt_playlist_name = body.get('yt_playlist_name')
+        resume_transfer_id = body.get('transfer_id')
+        run_in_background = bool(body.get('background'))
         
         print(f"DEBUG: Received tokens - Spotify: {spotify_token_info is not None}, YTMusic: {ytmusic_token_info is not None}")
         
@@ -212,56 +303,67 @@ def transfer_playlist(request):
     if not playlist_identifier:
         return JsonResponse({'error': 'Playlist identifier is required.'}, status=400)
 
+    admission = get_admission()
+    try:
+        admission.precheck(background=run_in_background)
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+
     # Initialize Spotify client with provided token
     try:
-        sp = spotipy.Spotify(auth=spotify_token_info['access_token'])
+        sp = providers.spotify_client(spotify_token_info['access_token'])
         # Test the token
-        sp.current_user()
+        spotify_user = sp.current_user()
         print("DEBUG: Spotify token validated successfully")
+    except CircuitOpenError as e:
+        return _provider_unavailable(e)
+    except DeadlineExceeded:
+        return _timed_out('Spotify')
     except Exception as e:
         print(f"ERROR: Invalid Spotify token: {e}")
         return JsonResponse({'error': 'Invalid Spotify token. Please re-authenticate.'}, status=401)
 
+    # Extract playlist ID from various Spotify URL formats
+    playlist_id = parse_playlist_id(playlist_identifier)
+    print(f"DEBUG: Extracted playlist ID: {playlist_id}")
+
+    # Size the transfer with a cheap lookup and see if there is room for it
+    # before doing any real work
+    try:
+        playlist_summary = sp.playlist(playlist_id, fields="name,tracks.total")
+    except CircuitOpenError as e:
+        return _provider_unavailable(e)
+    except DeadlineExceeded:
+        return _timed_out('Spotify')
+    except Exception as e:
+        print(f"ERROR: Failed to fetch Spotify playlist: {e}")
+        return JsonResponse({'error': f'Failed to fetch Spotify playlist: {str(e)}'}, status=400)
+    track_total = playlist_summary.get('tracks', {}).get('total', 0)
+    try:
+        # A synchronous transfer only reads the first page of the playlist
+        request.admission_ticket = admission.admit(
+            spotify_user.get('id', '') if spotify_user else '',
+            track_total if run_in_background else min(track_total, SYNC_TRACK_LIMIT),
+            background=run_in_background,
+        )
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+
     # Initialize YouTube Music client with provided token
     try:
         print("DEBUG: Creating YouTube Music client...")
         
-        # Create OAuth credentials for YTMusic using the client credentials from settings
-        oauth_credentials = OAuthCredentials(
-            client_id=settings.YTM_CLIENT_ID,
-            client_secret=settings.YTM_CLIENT_SECRET
-        )
-        
-        print("DEBUG: OAuth credentials created")
-        
-        # Create a temporary token file with the user's token info
-        import tempfile
-        import os
-        
-        # Create a temporary file to store the token
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-            # Write the token info in the format expected by YTMusic
-            token_data = {
-                "access_token": ytmusic_token_info['access_token'],
-                "refresh_token": ytmusic_token_info.get('refresh_token'),
-                "scope": ytmusic_token_info.get('scopes', ['https://www.googleapis.com/auth/youtube']),
-                "token_type": "Bearer",
-                "expires_at": ytmusic_token_info.get('expires_at')
-            }
-            json.dump(token_data, temp_file)
-            temp_token_file = temp_file.name
-        
-        print(f"DEBUG: Created temporary token file: {temp_token_file}")
-        
-        # Initialize YTMusic with the token file and OAuth credentials
-        ytmusic = YTMusic(auth=temp_token_file, oauth_credentials=oauth_credentials)
+        # Initialize YTMusic with a temporary token file and the app's OAuth credentials
+        ytmusic, temp_token_file = providers.ytmusic_client(ytmusic_token_info)
         
-        print("DEBUG: YTMusic client initialized")
+        print(f"DEBUG: YTMusic client initialized with token file: {temp_token_file}")
         
         # Test the YouTube Music connection
         try:
-            # Try to get library playlists to validate the token
-            test_playlists = ytmusic.get_library_playlists(limit=1)
+            # Try to get library playlists to validate the token; a bad
+            # token is the user's problem, not YouTube Music's, so this
+            # call doesn't count towards the circuit breaker
+            test_playlists = ytmusic.uncounted('get_library_playlists', limit=1)
             print("DEBUG: YouTube Music token validated successfully")
         except Exception as e:
             print(f"ERROR: YouTube Music token validation failed: {e}")
@@ -270,6 +372,10 @@ def transfer_playlist(request):
                 os.unlink(temp_token_file)
             except:
                 pass
+            if isinstance(e, CircuitOpenError):
+                return _provider_unavailable(e)
+            if isinstance(e, DeadlineExceeded):
+                return _timed_out('YouTube Music')
             return JsonResponse({'error': 'Invalid YouTube Music token. Please re-authenticate.'}, status=401)
             
     except Exception as e:
@@ -282,18 +388,17 @@ def transfer_playlist(request):
     try:
         print("DEBUG: Starting playlist transfer logic...")
         
-        # Extract playlist ID from various Spotify URL formats
-        playlist_id = playlist_identifier
-        if "open.spotify.com/playlist/" in playlist_identifier:
-            playlist_id = playlist_identifier.split("/")[-1].split("?")[0]
-        elif "spotify:playlist:" in playlist_identifier:
-            playlist_id = playlist_identifier.split(":")[-1]
-        
-        print(f"DEBUG: Extracted playlist ID: {playlist_id}")
+        if run_in_background:
+            try:
+                os.unlink(temp_token_file)
+            except:
+                pass
+            return _queue_background_transfer(request, spotify_user, playlist_id, playlist_summary, yt_playlist_name,
+                                              spotify_token_info, ytmusic_token_info)
         
         # Get Spotify playlist info
         try:
-            spotify_playlist = sp.playlist(playlist_id, fields="name,description,tracks.items(track(name,artists(name),external_urls))")
+            spotify_playlist = sp.playlist(playlist_id, fields=f"name,description,tracks.items(track({TRACK_FIELDS},external_urls))")
             spotify_playlist_name = spotify_playlist.get('name', 'Unknown Playlist')
             print(f"DEBUG: Spotify playlist name: {spotify_playlist_name}")
             
@@ -307,6 +412,10 @@ def transfer_playlist(request):
                 os.unlink(temp_token_file)
             except:
                 pass
+            if isinstance(e, CircuitOpenError):
+                return _provider_unavailable(e)
+            if isinstance(e, DeadlineExceeded):
+                return _timed_out('Spotify')
             return JsonResponse({'error': f'Failed to fetch Spotify playlist: {str(e)}'}, status=400)
         
         # Get playlist tracks
@@ -314,13 +423,8 @@ def transfer_playlist(request):
         spotify_songs = []
         
         for item in tracks:
-            track = item.get('track')
-            if track and track.get('name'):
-                song_info = {
-                    'title': track['name'],
-                    'artist': ', '.join([artist['name'] for artist in track.get('artists', [])]),
-                    'spotify_url': track.get('external_urls', {}).get('spotify', '')
-                }
+            song_info = song_from_track(item.get('track'))
+            if song_info:
                 spotify_songs.append(song_info)
         
         print(f"DEBUG: Found {len(spotify_songs)} tracks in Spotify playlist")
@@ -333,45 +437,145 @@ def transfer_playlist(request):
                 pass
             return JsonResponse({'error': 'No tracks found in the Spotify playlist'}, status=400)
         
+        spotify_user_id = spotify_user.get('id', '') if spotify_user else ''
+        done_results = {}
+        if resume_transfer_id:
+            # Continue a transfer that was paused while a provider was down,
+            # keeping the results it already has
+            transfer = Transfer.objects.filter(
+                public_id=resume_transfer_id, spotify_user_id=spotify_user_id, status=Transfer.STATUS_PAUSED
+            ).first() if is_uuid(resume_transfer_id) else None
+            if transfer is None:
+                try:
+                    os.unlink(temp_token_file)
+                except:
+                    pass
+                return JsonResponse({'error': 'No paused transfer found with that transfer_id.'}, status=404)
+            if transfer.spotify_playlist_id != playlist_id:
+                # Its results are positions in its own playlist
+                try:
+                    os.unlink(temp_token_file)
+                except:
+                    pass
+                return JsonResponse({'error': 'That transfer_id belongs to a transfer of another playlist.',
+                                     'transfer_id': str(transfer.public_id),
+                                     'playlist_identifier': transfer.spotify_playlist_id}, status=409)
+            done_results = {result.position: result for result in transfer.track_results.all()}
+            transfer.status = Transfer.STATUS_RUNNING
+            transfer.track_count = len(spotify_songs)
+            transfer.save(update_fields=['status', 'track_count', 'updated_at'])
+            yt_playlist_name = transfer.yt_playlist_name or yt_playlist_name
+            print(f"DEBUG: Resuming transfer {transfer.public_id} with {len(done_results)} tracks already done")
+        else:
+            transfer = Transfer.objects.create(
+                spotify_user_id=spotify_user_id,
+                spotify_playlist_id=playlist_id,
+                spotify_playlist_name=spotify_playlist_name[:255],
+                yt_playlist_name=yt_playlist_name[:255],
+                track_count=len(spotify_songs),
+            )
+        writer = TrackResultWriter(transfer, batch_size=settings.TRANSFER_RESULT_BATCH_SIZE)
+        
         # Search for songs on YouTube Music and collect video IDs
         found_video_ids = []
+        found_results = []
         not_found_songs = []
         
+        # Tracks already in the match cache need no search; the rest run on
+        # the shared scheduler so they interleave fairly with other users'
+        # transfers. Results are consumed in playlist order.
+        cache_hits = cached_matches(spotify_songs)
+        to_search = [i for i in range(len(spotify_songs)) if i not in done_results and i not in cache_hits]
+        print(f"DEBUG: {len(cache_hits)} tracks found in the match cache, {len(to_search)} to search")
+        search_job = get_scheduler().job(transfer.spotify_user_id, size=len(to_search))
+        searches = {i: completed_future((video_id, 'cache', None)) for i, video_id in cache_hits.items() if i not in done_results}
+        # Searching stops TRANSFER_DEADLINE_WRITE_RESERVE_SECONDS before the
+        # deadline, leaving time to write what was found to the playlist
+        with deadline(search_budget()) as search_deadline:
+            searches.update({i: search_job.submit(search_song, ytmusic, spotify_songs[i]) for i in to_search})
+        new_matches = []
+        paused_by = None
+        out_of_time = False
+        # Search errors are only written once we know the provider wasn't
+        # degraded; if the transfer pauses they're retried on resume instead
+        failed_results = []
+        
         for i, song in enumerate(spotify_songs):
-            print(f"DEBUG: Searching for song {i+1}/{len(spotify_songs)}: {song['title']} by {song['artist']}")
+            if i in done_results:
+                result = done_results[i]
+                if result.video_id and result.status in (TrackResult.STATUS_MATCHED, TrackResult.STATUS_ADDED):
+                    found_video_ids.append(result.video_id)
+                    found_results.append(result)
+                else:
+                    not_found_songs.append(song)
+                continue
+            
+            search = searches[i]
+            if (paused_by is not None or out_of_time) and not (search.done() and not search.cancelled() and search.exception() is None):
+                # Left for the resumed run rather than recorded as a failure
+                search.cancel()
+                continue
             
             try:
-                # Search for the song on YouTube Music
-                query = f"{song['title']} {song['artist']}"
-                search_results = ytmusic.search(query, filter="songs", limit=5)
-                
-                video_id = None
-                if search_results:
-                    # Try to find the best match
-                    for result in search_results:
-                        if result.get('resultType') == 'song':
-                            video_id = result.get('videoId')
-                            print(f"DEBUG: Found match: {result.get('title')} - {video_id}")
-                            break
-                    
-                    # Fallback to first result if no song type found
-                    if not video_id and search_results[0].get('videoId'):
-                        video_id = search_results[0]['videoId']
-                        print(f"DEBUG: Using fallback match: {search_results[0].get('title')} - {video_id}")
+                video_id, strategy, score = search.result(
+                    timeout=max(0, search_deadline.remaining()) if search_deadline is not None else None)
                 
                 if video_id:
                     found_video_ids.append(video_id)
+                    found_results.append(writer.add(track_result(i, song, TrackResult.STATUS_MATCHED,
+                                                                  video_id=video_id, strategy=strategy, score=score)))
+                    if strategy in CACHED_STRATEGIES:
+                        new_matches.append((song, video_id, strategy))
                 else:
                     not_found_songs.append(song)
+                    writer.add(track_result(i, song, TrackResult.STATUS_NOT_FOUND))
                     print(f"DEBUG: No match found for: {song['title']} by {song['artist']}")
                     
+            except (DeadlineExceeded, FutureTimeoutError):
+                print(f"DEBUG: Transfer {transfer.public_id} ran out of time after {i} of {len(spotify_songs)} tracks")
+                out_of_time = True
+                search.cancel()
+                continue
             except Exception as e:
+                if isinstance(e, CircuitOpenError) or get_breaker('ytmusic').state != get_breaker('ytmusic').CLOSED:
+                    # YouTube Music is degraded: pause instead of filling the
+                    # results with failures that say nothing about the song
+                    paused_by = e if isinstance(e, CircuitOpenError) else CircuitOpenError(
+                        'ytmusic', get_breaker('ytmusic').retry_after())
+                    print(f"DEBUG: Pausing transfer {transfer.public_id}: {paused_by}")
+                    continue
                 print(f"ERROR: Failed to search for song {song['title']}: {e}")
                 not_found_songs.append(song)
+                failed_results.append(track_result(i, song, TrackResult.STATUS_FAILED))
+        
+        store_matches(new_matches)
+        
+        if paused_by is not None:
+            writer.flush()
+            finish_transfer(transfer, Transfer.STATUS_PAUSED, len(found_video_ids),
+                             len(not_found_songs) - len(failed_results), yt_playlist_id=transfer.yt_playlist_id)
+            try:
+                os.unlink(temp_token_file)
+            except:
+                pass
+            return _provider_unavailable(paused_by, transfer)
+        
+        for result in failed_results:
+            writer.add(result)
         
         print(f"DEBUG: Found {len(found_video_ids)} songs on YouTube Music, {len(not_found_songs)} not found")
         
+        if out_of_time and not found_video_ids:
+            writer.flush()
+            try:
+                os.unlink(temp_token_file)
+            except:
+                pass
+            return _out_of_time(transfer, len(spotify_songs), 0, len(not_found_songs))
+        
         if not found_video_ids:
+            writer.flush()
+            finish_transfer(transfer, Transfer.STATUS_FAILED, 0, len(not_found_songs))
             # Clean up the temporary file
             try:
                 os.unlink(temp_token_file)
@@ -381,19 +585,36 @@ def transfer_playlist(request):
         
         # Create YouTube Music playlist
         try:
-            print(f"DEBUG: Creating YouTube Music playlist: {yt_playlist_name}")
-            playlist_id = ytmusic.create_playlist(
-                title=yt_playlist_name,
-                description=f"Transferred from Spotify playlist '{spotify_playlist_name}'",
-                privacy_status="PRIVATE"
-            )
-            print(f"DEBUG: Created playlist with ID: {playlist_id}")
+            if transfer.yt_playlist_id:
+                # Created by an earlier attempt that was paused before adding songs
+                playlist_id = transfer.yt_playlist_id
+            else:
+                print(f"DEBUG: Creating YouTube Music playlist: {yt_playlist_name}")
+                playlist_id = ytmusic.create_playlist(
+                    title=yt_playlist_name,
+                    description=f"Transferred from Spotify playlist '{spotify_playlist_name}'",
+                    privacy_status="PRIVATE"
+                )
+                print(f"DEBUG: Created playlist with ID: {playlist_id}")
+                transfer.yt_playlist_id = playlist_id
             
-            # Add songs to the playlist
-            if found_video_ids:
-                print(f"DEBUG: Adding {len(found_video_ids)} songs to playlist")
-                add_result = ytmusic.add_playlist_items(playlist_id, found_video_ids)
+            # Add songs to the playlist, except those an earlier, cut off
+            # attempt already added. YouTube Music rejects a whole add that
+            # repeats a video, so each video goes in once.
+            to_add = [result for result in found_results if result.status != TrackResult.STATUS_ADDED]
+            already_added = {result.video_id for result in found_results if result.status == TrackResult.STATUS_ADDED}
+            video_ids = list(dict.fromkeys(result.video_id for result in to_add if result.video_id not in already_added))
+            if video_ids:
+                print(f"DEBUG: Adding {len(video_ids)} songs to playlist")
+                add_result = add_to_playlist(ytmusic, playlist_id, video_ids)
                 print(f"DEBUG: Add result: {add_result}")
+            for result in to_add:
+                result.status = TrackResult.STATUS_ADDED
+                writer.update(result, ['status'])
+            
+            writer.flush()
+            finish_transfer(transfer, Transfer.STATUS_PAUSED if out_of_time else Transfer.STATUS_COMPLETED,
+                            len(found_video_ids), len(not_found_songs), yt_playlist_id=playlist_id)
             
             # Clean up the temporary file
             try:
@@ -404,23 +625,73 @@ def transfer_playlist(request):
             # Prepare response
             response_data = {
                 'message': f'Successfully transferred playlist to YouTube Music',
+                'transfer_id': str(transfer.public_id),
                 'playlist_id': playlist_id,
                 'spotify_track_count': len(spotify_songs),
                 'songs_found_count': len(found_video_ids),
                 'songs_not_found_count': len(not_found_songs),
-                'yt_playlist_name': yt_playlist_name
+                'yt_playlist_name': yt_playlist_name,
+                'report_url': request.build_absolute_uri(reverse('transfer_report', args=[transfer.public_id])),
             }
             
             if not_found_songs:
-                response_data['not_found_songs'] = not_found_songs[:10]  # Limit to first 10 for response size
+                # Limit to first 10 for response size; report_url has every track
+                response_data['not_found_songs'] = not_found_songs[:10]
                 response_data['warning'] = f'{len(not_found_songs)} songs could not be found on YouTube Music'
             
+            if out_of_time:
+                # What was found is in the playlist; the rest waits for a resumed run
+                response_data.update(_transfer_account(transfer, len(spotify_songs), len(found_video_ids),
+                                                       len(not_found_songs), len(found_video_ids)))
+                response_data['message'] = (f"Transferred {len(found_video_ids) + len(not_found_songs)} of "
+                                            f"{len(spotify_songs)} songs before the time limit. POST again with "
+                                            f"this transfer_id to transfer the rest.")
+            
             return JsonResponse(response_data)
             
+        except CircuitOpenError as e:
+            writer.flush()
+            finish_transfer(transfer, Transfer.STATUS_PAUSED, len(found_video_ids), len(not_found_songs),
+                             yt_playlist_id=transfer.yt_playlist_id)
+            try:
+                os.unlink(temp_token_file)
+            except:
+                pass
+            return _provider_unavailable(e, transfer)
+            
+        except PlaylistWriteError as e:
+            # Nothing was added: the matches are kept so a resumed run adds them
+            print(f"ERROR: {e}")
+            writer.flush()
+            finish_transfer(transfer, Transfer.STATUS_PAUSED, len(found_video_ids), len(not_found_songs),
+                            yt_playlist_id=transfer.yt_playlist_id)
+            try:
+                os.unlink(temp_token_file)
+            except:
+                pass
+            return JsonResponse({
+                'error': 'YouTube Music did not add the songs to the playlist. '
+                         'POST again with this transfer_id to retry.',
+                'retryable': True,
+                'transfer_id': str(transfer.public_id),
+                'playlist_id': transfer.yt_playlist_id or None,
+            }, status=502)
+            
+        except DeadlineExceeded:
+            writer.flush()
+            try:
+                os.unlink(temp_token_file)
+            except:
+                pass
+            added = sum(1 for result in found_results if result.status == TrackResult.STATUS_ADDED)
+            return _out_of_time(transfer, len(spotify_songs), len(found_video_ids), len(not_found_songs), added)
+            
         except Exception as e:
             print(f"ERROR: Failed to create YouTube Music playlist: {e}")
             import traceback
             traceback.print_exc()
+            writer.flush()
+            finish_transfer(transfer, Transfer.STATUS_FAILED, len(found_video_ids), len(not_found_songs))
             # Clean up the temporary file
             try:
                 os.unlink(temp_token_file)
@@ -432,6 +703,8 @@ def transfer_playlist(request):
         print(f"ERROR: Transfer logic failed: {e}")
         import traceback
         traceback.print_exc()
+        if 'transfer' in locals():
+            finish_transfer(transfer, Transfer.STATUS_FAILED, transfer.found_count, transfer.not_found_count)
         # Clean up the temporary file if it exists
         try:
             if 'temp_token_file' in locals():
@@ -439,3 +712,83 @@ def transfer_playlist(request):
         except:
             pass
         return JsonResponse({'error': f'Transfer failed: {str(e)}'}, status=500)
+
+
+@require_http_methods(["GET"])
+def transfer_status(request, public_id):
+    """Status and progress of a transfer, for polling background transfers."""
+    transfer = Transfer.objects.filter(public_id=public_id).first()
+    if transfer is None:
+        return JsonResponse({'error': 'Transfer not found.'}, status=404)
+    
+    response_data = {
+        'transfer_id': str(transfer.public_id),
+        'status': transfer.status,
+        'spotify_playlist_name': transfer.spotify_playlist_name,
+        'yt_playlist_name': transfer.yt_playlist_name,
+        'playlist_id': transfer.yt_playlist_id or None,
+        'spotify_track_count': transfer.track_count,
+        'songs_found_count': transfer.found_count,
+        'songs_not_found_count': transfer.not_found_count,
+        'created_at': transfer.created_at.isoformat(),
+        'updated_at': transfer.updated_at.isoformat(),
+    }
+    if transfer.status in (Transfer.STATUS_PAUSED, Transfer.STATUS_PARTIAL):
+        # Tracks never searched: left for a resumed run, or skipped at the deadline
+        response_data['songs_remaining_count'] = max(
+            0, transfer.track_count - transfer.found_count - transfer.not_found_count)
+    response_data.update(jobs.transfer_progress(transfer))
+    response_data['report_url'] = request.build_absolute_uri(reverse('transfer_report', args=[transfer.public_id]))
+    return JsonResponse(response_data)
+
+
+@require_http_methods(["GET"])
+def transfer_report(request, public_id):
+    """Per-track outcome of a transfer, streamed as NDJSON (default) or CSV.
+
+    Query parameters: format=ndjson|csv, limit (tracks per page) and cursor.
+    When there are more tracks, the X-Next-Cursor and Link headers give the
+    cursor / URL of the next page.
+    """
+    transfer = Transfer.objects.filter(public_id=public_id).first()
+    if transfer is None:
+        return JsonResponse({'error': 'Transfer not found.'}, status=404)
+    
+    output_format = request.GET.get('format', 'ndjson')
+    if output_format not in reports.FORMATS:
+        return JsonResponse({'error': f"Unknown format {output_format!r}; use one of: {', '.join(reports.FORMATS)}."},
+                            status=400)
+    try:
+        limit = int(request.GET.get('limit', settings.TRANSFER_REPORT_PAGE_SIZE))
+        cursor = request.GET.get('cursor')
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return JsonResponse({'error': 'limit and cursor must be integers.'}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'limit must be at least 1.'}, status=400)
+    limit = min(limit, settings.TRANSFER_REPORT_MAX_PAGE_SIZE)
+    
+    rows, next_cursor = reports.page(transfer, after=cursor, limit=limit)
+    response = StreamingHttpResponse(reports.render(rows, output_format),
+                                     content_type=reports.FORMATS[output_format])
+    if output_format == 'csv':
+        response['Content-Disposition'] = f'attachment; filename="transfer-{transfer.public_id}.csv"'
+    if next_cursor is not None:
+        query = request.GET.copy()
+        query['cursor'] = next_cursor
+        response['X-Next-Cursor'] = str(next_cursor)
+        response['Link'] = f'<{request.build_absolute_uri(request.path)}?{query.urlencode()}>; rel="next"'
+    return response
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Operational counters for this process: admission control, scheduler, circuit breakers,
+    search hedging and match snapshot."""
+    return JsonResponse({
+        'admission': get_admission().stats(),
+        'scheduler': get_scheduler().stats(),
+        'circuit_breakers': {name: breaker.stats() for name, breaker in all_breakers().items()},
+        'search_hedging': hedging_stats(),
+        'match_snapshot': snapshot_stats(),
+    })
@@ -0,0 +1,144 @@
+from datetime import timedelta
+import time
+
+from django.db.models import Count
+from django.utils import timezone
+
+from .breakers import CircuitOpenError
+from .matching import CACHED_STRATEGIES, cached_matches, song_key_hash, store_matches
+from .models import Transfer
+from .transfers import TRACK_FIELDS, parse_playlist_id, search_song, song_from_track
+
+
+# Pre-resolves tracks of likely-to-be-transferred playlists into the match
+# cache, so interactive transfers mostly skip the live search. Driven by
+# `manage.py warm_match_cache`, meant to run off-peak from cron.
+
+STORE_EVERY = 100
+
+
+def popular_playlist_ids(limit, days):
+    """The playlists transferred most often in the last `days` days."""
+    since = timezone.now() - timedelta(days=days)
+    return list(
+        Transfer.objects.filter(created_at__gte=since)
+        .values('spotify_playlist_id').annotate(n=Count('id')).order_by('-n')
+        .values_list('spotify_playlist_id', flat=True)[:limit]
+    )
+
+
+def playlist_songs(sp, playlist_id, max_tracks):
+    songs = []
+    offset = 0
+    while len(songs) < max_tracks:
+        page = sp.playlist_items(playlist_id, offset=offset, limit=100,
+                                 fields=f'next,items(track({TRACK_FIELDS}))')
+        for item in page.get('items') or []:
+            song = song_from_track(item.get('track'))
+            if song:
+                songs.append(song)
+        if not page.get('next'):
+            break
+        offset += 100
+    return songs[:max_tracks]
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+def warm(playlist_identifiers, sp, ytmusic, max_tracks=500, searches_per_second=2.0, max_searches=None, log=print):
+    """Resolve the tracks of the given playlists into the match cache.
+
+    Returns a report with per-playlist and overall cache coverage (share of
+    unique tracks with a cache entry) before and after the run.
+    """
+    report = {'playlists': [], 'searched': 0, 'resolved': 0, 'fallback': 0, 'not_found': 0, 'failed': 0,
+              'stopped_reason': None}
+    playlists = []
+    for identifier in playlist_identifiers:
+        playlist_id = parse_playlist_id(identifier)
+        try:
+            songs = playlist_songs(sp, playlist_id, max_tracks)
+        except CircuitOpenError as e:
+            report['stopped_reason'] = str(e)
+            break
+        except Exception as e:
+            log(f"ERROR: Failed to fetch Spotify playlist {playlist_id}: {e}")
+            continue
+        playlists.append((playlist_id, songs))
+
+    # Unique tracks across all playlists; popular songs appear in many
+    unique = {}
+    for _, songs in playlists:
+        for song in songs:
+            unique.setdefault(song_key_hash(song), song)
+    hashes = list(unique)
+    songs = [unique[h] for h in hashes]
+    cached_before = {hashes[i] for i in cached_matches(songs)}
+
+    limiter = RateLimiter(searches_per_second)
+    pending_store = []
+    resolved = set()
+    for h, song in zip(hashes, songs):
+        if h in cached_before:
+            continue
+        if max_searches is not None and report['searched'] >= max_searches:
+            report['stopped_reason'] = f'search budget of {max_searches} used up'
+            break
+        limiter.wait()
+        try:
+            video_id, strategy, _ = search_song(ytmusic, song)
+        except CircuitOpenError as e:
+            # Rejected by the breaker without being sent, so not counted as a search
+            report['stopped_reason'] = str(e)
+            break
+        except Exception as e:
+            log(f"ERROR: Failed to search for song {song['title']}: {e}")
+            report['searched'] += 1
+            report['failed'] += 1
+            continue
+        report['searched'] += 1
+        if video_id and strategy in CACHED_STRATEGIES:
+            resolved.add(h)
+            pending_store.append((song, video_id, strategy))
+            report['resolved'] += 1
+        elif video_id:
+            # Too weak a match to cache; left for a transfer to search again
+            report['fallback'] += 1
+        else:
+            report['not_found'] += 1
+        if len(pending_store) >= STORE_EVERY:
+            store_matches(pending_store)
+            pending_store = []
+            log(f"DEBUG: Warmed {report['resolved']} tracks so far ({report['searched']} searches)")
+    store_matches(pending_store)
+
+    cached_after = cached_before | resolved
+    for playlist_id, playlist in playlists:
+        playlist_hashes = {song_key_hash(song) for song in playlist}
+        report['playlists'].append({
+            'playlist_id': playlist_id,
+            'unique_tracks': len(playlist_hashes),
+            'coverage_before': _share(playlist_hashes & cached_before, playlist_hashes),
+            'coverage_after': _share(playlist_hashes & cached_after, playlist_hashes),
+        })
+    report['unique_tracks'] = len(hashes)
+    report['coverage_before'] = _share(cached_before, hashes)
+    report['coverage_after'] = _share(cached_after, hashes)
+    return report
+
+
+def _share(part, whole):
+    return round(len(part) / len(whole), 4) if whole else 1.0
@@ -0,0 +1,31 @@
+"""Shared bootstrap for benchmarks that need the ORM.
+
+Points the default database at a throwaway SQLite file (keeping the
+project's connection OPTIONS) and migrates it.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup(db_path=None):
+    sys.path.insert(0, str(BACKEND_DIR))
+    for name in ('SPOTIPY_CLIENT_ID', 'SPOTIPY_CLIENT_SECRET', 'SPOTIPY_REDIRECT_URI',
+                 'YTM_CLIENT_ID', 'YTM_CLIENT_SECRET'):
+        os.environ.setdefault(name, 'bench')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_ytmusic_project.settings')
+
+    import django
+    from django.conf import settings
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='s2y-bench-'), 'bench.sqlite3')
+    settings.DATABASES['default']['NAME'] = db_path
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_path
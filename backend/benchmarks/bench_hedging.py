@@ -0,0 +1,74 @@
+"""Tail latency of a heavy-tailed fake search with and without hedging.
+
+Most calls take ~`--base-ms`, but `--slow-share` of them hang for
+`--slow-ms` (a stuck connection, a slow backend replica). Runs the same
+call sequence through api_v1.hedging.Hedger and directly, from several
+threads like the transfer scheduler does, and reports latency percentiles
+plus the hedger's own stats.
+
+    python benchmarks/bench_hedging.py [--calls 2000] [--budget 0.05]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api_v1.hedging import Hedger  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+def make_search(args, seed):
+    rng = random.Random(seed)
+
+    def fake_search():
+        if rng.random() < args.slow_share:
+            time.sleep(args.slow_ms / 1000.0)
+        else:
+            time.sleep(rng.uniform(0.7, 1.3) * args.base_ms / 1000.0)
+    return fake_search
+
+
+def run(call, calls, threads):
+    def timed(_):
+        start = time.perf_counter()
+        call()
+        return time.perf_counter() - start
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(timed, range(calls)))
+
+
+def report(label, latencies):
+    print(f"{label:<8} p50 {percentile(latencies, 50) * 1000:7.1f} ms  p95 {percentile(latencies, 95) * 1000:7.1f} ms"
+          f"  p99 {percentile(latencies, 99) * 1000:7.1f} ms  max {max(latencies) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--base-ms', type=float, default=5.0)
+    parser.add_argument('--slow-ms', type=float, default=200.0)
+    parser.add_argument('--slow-share', type=float, default=0.03)
+    parser.add_argument('--percentile', type=float, default=95.0)
+    parser.add_argument('--budget', type=float, default=0.05)
+    args = parser.parse_args()
+
+    report('direct', run(make_search(args, 1), args.calls, args.threads))
+    hedger = Hedger(percentile=args.percentile, budget_ratio=args.budget, min_delay=0.001,
+                    max_workers=2 * args.threads)
+    search = make_search(args, 1)
+    report('hedged', run(lambda: hedger.call(search), args.calls, args.threads))
+    print(json.dumps(hedger.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
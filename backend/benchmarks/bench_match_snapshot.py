@@ -0,0 +1,97 @@
+"""Match cache lookups from the database vs. the memory-mapped snapshot.
+
+Fills the match cache with `--entries` rows, compiles the snapshot, then
+times cached_matches() for playlists of `--playlist` tracks (`--hit-rate`
+of them cached) with the snapshot disabled and enabled. Finally rebuilds
+the snapshot `--swaps` times while other threads keep looking tracks up,
+to check that readers switch over without errors or missing entries.
+
+    python benchmarks/bench_match_snapshot.py [--entries 200000] [--playlist 500]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=200000)
+    parser.add_argument('--playlist', type=int, default=500)
+    parser.add_argument('--hit-rate', type=float, default=0.8)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--swaps', type=int, default=5)
+    args = parser.parse_args()
+
+    _django.setup()
+    from django.conf import settings
+    from api_v1 import matching, snapshot
+    from api_v1.models import MatchCacheEntry
+
+    MatchCacheEntry.objects.bulk_create(
+        [MatchCacheEntry(key_hash=matching.key_hash(f'Song {i}', 'Artist'), video_id=f'v{i:010d}', strategy='song')
+         for i in range(args.entries)],
+        batch_size=5000,
+    )
+    path = os.path.join(tempfile.mkdtemp(prefix='s2y-bench-'), 'match_snapshot.bin')
+    started = time.perf_counter()
+    count = matching.build_snapshot(path, args.entries)
+    print(f"snapshot: {count} entries, {os.path.getsize(path) / 1e6:.1f} MB, built in "
+          f"{time.perf_counter() - started:.2f}s")
+
+    rng = random.Random(1)
+    playlists = [
+        [{'title': f'Song {rng.randrange(args.entries)}' if rng.random() < args.hit_rate else f'Unknown {rng.random()}',
+          'artist': 'Artist'} for _ in range(args.playlist)]
+        for _ in range(args.rounds)
+    ]
+
+    def timed(label):
+        snapshot._reader = None
+        started = time.perf_counter()
+        hits = sum(len(matching.cached_matches(songs)) for songs in playlists)
+        elapsed = (time.perf_counter() - started) / args.rounds
+        print(f"{label:<9} {elapsed * 1000:7.2f} ms per {args.playlist}-track playlist  "
+              f"(hit rate {hits / (args.rounds * args.playlist):.0%})")
+
+    settings.MATCH_SNAPSHOT_PATH = ''
+    timed('database')
+    settings.MATCH_SNAPSHOT_PATH = path
+    settings.MATCH_SNAPSHOT_CHECK_SECONDS = 0.0
+    timed('snapshot')
+
+    # Readers vs. concurrent rebuilds; each rebuild has the same content
+    snapshot._reader = None
+    snapshot.current_snapshot()
+    stop = threading.Event()
+    errors, lookups = [], [0]
+    expected = {matching.key_hash(f'Song {i}', 'Artist'): f'v{i:010d}' for i in range(0, args.entries, 97)}
+
+    def reader():
+        while not stop.is_set():
+            current = snapshot.current_snapshot()
+            try:
+                for key, video_id in expected.items():
+                    if current.get(key) != video_id:
+                        errors.append(key)
+            except Exception as e:
+                errors.append(e)
+            lookups[0] += len(expected)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for _ in range(args.swaps):
+        matching.build_snapshot(path, args.entries)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"swaps:    {args.swaps} rebuilds during {lookups[0]} lookups, {len(errors)} errors")
+
+
+if __name__ == '__main__':
+    main()
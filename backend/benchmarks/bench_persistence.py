@@ -0,0 +1,94 @@
+"""Rows/sec for persisting the per-track results of one large transfer.
+
+Simulates what transfer_playlist writes for an N-track playlist: one result
+row per track (matched / not found), then every matched row flipped to
+"added" after the playlist write. `per-row` saves each row on its own as a
+naive implementation would; `buffered` goes through TrackResultWriter.
+
+    python benchmarks/bench_persistence.py [--tracks 10000] [--batch-size 500]
+"""
+import argparse
+import time
+
+import _django
+
+
+def fake_songs(count):
+    return [
+        {'spotify_id': f'{i:022d}', 'title': f'Song {i}', 'artist': f'Artist {i % 997}'}
+        for i in range(count)
+    ]
+
+
+def make_result(TrackResult, position, song):
+    matched = position % 10 != 0
+    return TrackResult(
+        position=position,
+        spotify_id=song['spotify_id'],
+        title=song['title'],
+        artist=song['artist'],
+        video_id=f'v{position:010d}' if matched else '',
+        strategy='song' if matched else '',
+        status=TrackResult.STATUS_MATCHED if matched else TrackResult.STATUS_NOT_FOUND,
+    )
+
+
+def run_per_row(Transfer, TrackResult, songs):
+    transfer = Transfer.objects.create(spotify_playlist_id='bench-per-row', track_count=len(songs))
+    matched = []
+    for i, song in enumerate(songs):
+        result = make_result(TrackResult, i, song)
+        result.transfer = transfer
+        result.save()
+        if result.status == TrackResult.STATUS_MATCHED:
+            matched.append(result)
+    for result in matched:
+        result.status = TrackResult.STATUS_ADDED
+        result.save(update_fields=['status'])
+    return len(songs) + len(matched)
+
+
+def run_buffered(Transfer, TrackResult, TrackResultWriter, songs, batch_size):
+    transfer = Transfer.objects.create(spotify_playlist_id='bench-buffered', track_count=len(songs))
+    writer = TrackResultWriter(transfer, batch_size=batch_size)
+    matched = []
+    for i, song in enumerate(songs):
+        result = writer.add(make_result(TrackResult, i, song))
+        if result.status == TrackResult.STATUS_MATCHED:
+            matched.append(result)
+    for result in matched:
+        result.status = TrackResult.STATUS_ADDED
+        writer.update(result, ['status'])
+    writer.flush()
+    return len(songs) + len(matched)
+
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    rows = fn(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<9} {rows:7d} row writes in {elapsed:7.2f} s  -> {rows / elapsed:10.0f} rows/sec")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--skip-per-row', action='store_true', help="only run the buffered writer")
+    args = parser.parse_args()
+
+    db_path = _django.setup()
+    from api_v1.models import Transfer, TrackResult
+    from api_v1.persistence import TrackResultWriter
+
+    print(f"database: {db_path}")
+    songs = fake_songs(args.tracks)
+    buffered = timed('buffered', run_buffered, Transfer, TrackResult, TrackResultWriter, songs, args.batch_size)
+    if not args.skip_per_row:
+        per_row = timed('per-row', run_per_row, Transfer, TrackResult, songs)
+        print(f"speedup   {per_row / buffered:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Memory and time to produce a transfer's per-track report.
+
+Stores `--tracks` TrackResult rows for one transfer, then compares building
+the whole report as a single JSON document with streaming it through
+api_v1.reports page by page (`--limit` tracks per page), in both formats.
+Peak memory is Python allocations as seen by tracemalloc (in a second,
+untimed run).
+
+    python benchmarks/bench_report.py [--tracks 10000] [--limit 1000]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import _django
+
+
+def measure(label, produce):
+    # Timed without tracemalloc, which slows every allocation down
+    started = time.perf_counter()
+    size = produce()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    produce()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<16} {size / 1e6:6.2f} MB in {elapsed:5.2f}s, peak memory {peak / 1e6:6.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=10000)
+    parser.add_argument('--limit', type=int, default=1000)
+    args = parser.parse_args()
+
+    _django.setup()
+    from api_v1 import reports
+    from api_v1.models import Transfer, TrackResult
+
+    transfer = Transfer.objects.create(spotify_playlist_id='bench', track_count=args.tracks)
+    TrackResult.objects.bulk_create(
+        [TrackResult(transfer=transfer, position=i, spotify_id=f'{i:022d}', title=f'Song {i}', artist='Artist',
+                     video_id=f'v{i:010d}' if i % 10 else '', strategy='song' if i % 10 else '',
+                     status=TrackResult.STATUS_ADDED if i % 10 else TrackResult.STATUS_NOT_FOUND)
+         for i in range(args.tracks)],
+        batch_size=5000,
+    )
+
+    def whole_document():
+        rows = [reports._row(values) for values in
+                TrackResult.objects.filter(transfer=transfer).order_by('position').values_list(*reports._FIELDS)]
+        return len(json.dumps({'tracks': rows}))
+
+    def streamed(output_format):
+        def produce():
+            size, cursor = 0, None
+            while True:
+                rows, cursor = reports.page(transfer, after=cursor, limit=args.limit)
+                size += sum(len(chunk) for chunk in reports.render(rows, output_format))
+                if cursor is None:
+                    return size
+        return produce
+
+    measure('single document', whole_document)
+    measure('ndjson pages', streamed('ndjson'))
+    measure('csv pages', streamed('csv'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Simulated mixed load: small-transfer latency with and without fair scheduling.
+
+A few users migrate large libraries while a steady stream of other users
+transfer small playlists. Each "search" just sleeps for a jittered latency.
+`fifo` runs every search on a plain shared thread pool in arrival order
+(what happens when each big transfer simply grabs capacity); `fair` runs
+them through api_v1.scheduler.FairScheduler.
+
+    python benchmarks/bench_scheduler.py [--workers 8] [--search-ms 4]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api_v1.scheduler import FairScheduler  # noqa: E402
+
+
+def fake_search(latency):
+    time.sleep(latency)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def simulate(submit_job, args):
+    """Start the big jobs, then small ones at a fixed interval; return per-job latencies."""
+    rng = random.Random(42)
+    latencies = {'small': [], 'large': []}
+    lock = threading.Lock()
+
+    def run_job(kind, user_id, tracks):
+        start = time.perf_counter()
+        futures = submit_job(user_id, [rng.uniform(0.5, 1.5) * args.search_ms / 1000.0 for _ in range(tracks)])
+        for future in futures:
+            future.result()
+        with lock:
+            latencies[kind].append(time.perf_counter() - start)
+
+    threads = []
+    for n in range(args.large_jobs):
+        threads.append(threading.Thread(target=run_job, args=('large', f'big-{n}', args.large_tracks)))
+    for thread in threads:
+        thread.start()
+    for n in range(args.small_jobs):
+        time.sleep(args.small_interval_ms / 1000.0)
+        thread = threading.Thread(target=run_job, args=('small', f'small-{n}', args.small_tracks))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def report(label, latencies):
+    small = latencies['small']
+    large = latencies['large']
+    print(f"{label:<5} small jobs: p50 {statistics.median(small) * 1000:8.0f} ms"
+          f"  p95 {percentile(small, 95) * 1000:8.0f} ms  p99 {percentile(small, 99) * 1000:8.0f} ms"
+          f"  | large jobs: max {max(large) * 1000:8.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--per-user', type=int, default=2)
+    parser.add_argument('--search-ms', type=float, default=4.0)
+    parser.add_argument('--large-jobs', type=int, default=3)
+    parser.add_argument('--large-tracks', type=int, default=1500)
+    parser.add_argument('--small-jobs', type=int, default=40)
+    parser.add_argument('--small-tracks', type=int, default=20)
+    parser.add_argument('--small-interval-ms', type=float, default=40.0)
+    args = parser.parse_args()
+
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+
+    def fifo_submit(user_id, latencies):
+        return [pool.submit(fake_search, latency) for latency in latencies]
+
+    scheduler = FairScheduler(workers=args.workers, per_user_concurrency=args.per_user,
+                              small_job_tracks=max(args.small_tracks, 50))
+
+    def fair_submit(user_id, latencies):
+        job = scheduler.job(user_id, size=len(latencies))
+        return [job.submit(fake_search, latency) for latency in latencies]
+
+    report('fifo', simulate(fifo_submit, args))
+    report('fair', simulate(fair_submit, args))
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Spotify round trips and connections for loading track details.
+
+Runs a local stand-in for the Spotify Web API that charges `--handshake-ms`
+for every new connection (the TCP + TLS setup a real call to
+api.spotify.com pays) and `--call-ms` per request. Each simulated view
+request validates its token and loads details for `--tracks` tracks:
+
+`per-track`  a fresh spotipy.Spotify per request and one sp.track() per track
+`batched`    providers.spotify_client (shared keep-alive session) and
+             transfers.hydrate_songs (sp.tracks, 50 IDs per call)
+
+    python benchmarks/bench_spotify_client.py [--requests 10] [--tracks 200]
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import _django
+
+
+class FakeSpotify(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connections = 0
+    calls = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            FakeSpotify.connections += 1
+        time.sleep(self.server.handshake)
+
+    def do_GET(self):
+        with self.lock:
+            FakeSpotify.calls += 1
+        time.sleep(self.server.call)
+        url = urlparse(self.path)
+        if url.path == '/v1/me':
+            body = {'id': 'bench-user'}
+        elif url.path == '/v1/tracks/':
+            body = {'tracks': [self.track(track_id) for track_id in parse_qs(url.query)['ids'][0].split(',')]}
+        else:
+            body = self.track(url.path.rsplit('/', 1)[-1])
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def track(track_id):
+        return {'id': track_id, 'name': 'Song', 'artists': [{'name': 'Artist'}], 'duration_ms': 200000,
+                'external_ids': {'isrc': 'XX0000000000'}, 'album': {'name': 'Album'}}
+
+    def log_message(self, *args):
+        pass
+
+
+def track_ids(count):
+    return [f'{i:022d}' for i in range(count)]
+
+
+def per_track(prefix, args):
+    import spotipy
+    sp = spotipy.Spotify(auth='token')
+    sp.prefix = prefix
+    sp.current_user()
+    for track_id in track_ids(args.tracks):
+        sp.track(track_id)
+
+
+def batched(prefix, args):
+    from api_v1 import providers
+    from api_v1.transfers import hydrate_songs
+    sp = providers.spotify_client('token')
+    sp.unwrapped.prefix = prefix
+    sp.current_user()
+    hydrate_songs(sp, [{'spotify_id': track_id} for track_id in track_ids(args.tracks)])
+
+
+def run(label, fn, prefix, args):
+    FakeSpotify.connections = FakeSpotify.calls = 0
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        fn(prefix, args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} {elapsed / args.requests * 1000:8.1f} ms/request  "
+          f"{FakeSpotify.calls / args.requests:6.1f} calls/request  "
+          f"{FakeSpotify.connections:4d} connections total")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--tracks', type=int, default=200)
+    parser.add_argument('--handshake-ms', type=float, default=30.0)
+    parser.add_argument('--call-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    _django.setup()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSpotify)
+    server.daemon_threads = True
+    server.handshake = args.handshake_ms / 1000.0
+    server.call = args.call_ms / 1000.0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    prefix = f'http://127.0.0.1:{server.server_port}/v1/'
+
+    run('per-track', per_track, prefix, args)
+    run('batched', batched, prefix, args)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
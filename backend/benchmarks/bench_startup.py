@@ -0,0 +1,76 @@
+"""Measure worker startup cost: import time and RSS after loading the app.
+
+Each sample boots a fresh interpreter the way a gunicorn worker or a
+manage.py command would (django.setup() + importing the URLconf and views).
+`--eager` additionally imports the provider SDKs at boot, which is what every
+process paid before they were loaded lazily.
+
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+EAGER_IMPORTS = """
+import spotipy, spotipy.oauth2
+import ytmusicapi
+import google_auth_oauthlib.flow, google.oauth2.credentials, google.auth.transport.requests
+"""
+
+CHILD = """
+import json, os, resource, sys, time
+t0 = time.perf_counter()
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_ytmusic_project.settings')
+django.setup()
+%s
+import spotify_ytmusic_project.urls
+import api_v1.views
+elapsed = time.perf_counter() - t0
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': elapsed, 'rss_mb': rss_kb / 1024.0,
+                  'sdk_loaded': 'ytmusicapi' in sys.modules}))
+"""
+
+
+def sample(eager):
+    env = dict(os.environ)
+    for name in ('SPOTIPY_CLIENT_ID', 'SPOTIPY_CLIENT_SECRET', 'SPOTIPY_REDIRECT_URI',
+                 'YTM_CLIENT_ID', 'YTM_CLIENT_SECRET'):
+        env.setdefault(name, 'bench')
+    code = CHILD % (EAGER_IMPORTS if eager else '')
+    out = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def report(label, samples):
+    seconds = [s['seconds'] * 1000 for s in samples]
+    rss = [s['rss_mb'] for s in samples]
+    print(f"{label:<8} import {statistics.median(seconds):8.1f} ms (min {min(seconds):.1f})"
+          f"   rss {statistics.median(rss):7.1f} MB   sdk loaded: {samples[0]['sdk_loaded']}")
+    return statistics.median(seconds), statistics.median(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    # One throwaway run of each so .pyc files are warm for both variants
+    sample(True)
+    sample(False)
+
+    before = report('eager', [sample(True) for _ in range(args.runs)])
+    after = report('lazy', [sample(False) for _ in range(args.runs)])
+    print(f"saved    {before[0] - after[0]:8.1f} ms per worker, {before[1] - after[1]:.1f} MB RSS per worker")
+
+
+if __name__ == '__main__':
+    main()
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config #import config
+from decouple import Csv, config #import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -73,6 +73,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api_v1.middleware.RequestProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -115,9 +116,122 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Transfers write results from several workers at once: WAL lets
+            # readers proceed during writes, IMMEDIATE takes the write lock up
+            # front instead of failing on upgrade, and writers wait up to
+            # `timeout` seconds for the lock rather than erroring.
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-16000;'
+            ),
+        },
     }
 }
 
+# Number of per-track results buffered before they are flushed in one transaction
+TRANSFER_RESULT_BATCH_SIZE = config('TRANSFER_RESULT_BATCH_SIZE', default=500, cast=int)
+
+# Shared pool that runs YouTube Music searches for all transfers in this process,
+# fair-queued per user (see api_v1.scheduler)
+TRANSFER_SEARCH_WORKERS = config('TRANSFER_SEARCH_WORKERS', default=8, cast=int)
+TRANSFER_PER_USER_CONCURRENCY = config('TRANSFER_PER_USER_CONCURRENCY', default=2, cast=int)
+# Transfers with at most this many tracks take the fast lane
+TRANSFER_SMALL_JOB_TRACKS = config('TRANSFER_SMALL_JOB_TRACKS', default=50, cast=int)
+
+# Per-provider circuit breakers around Spotify / YouTube Music calls (see api_v1.breakers).
+# The circuit opens once at least MIN_CALLS were made in the last WINDOW_SECONDS and
+# FAILURE_RATE of them failed or took longer than SLOW_CALL_SECONDS; after
+# OPEN_SECONDS a probe call is let through to check for recovery.
+CIRCUIT_BREAKER_FAILURE_RATE = config('CIRCUIT_BREAKER_FAILURE_RATE', default=0.5, cast=float)
+CIRCUIT_BREAKER_SLOW_CALL_SECONDS = config('CIRCUIT_BREAKER_SLOW_CALL_SECONDS', default=10.0, cast=float)
+CIRCUIT_BREAKER_MIN_CALLS = config('CIRCUIT_BREAKER_MIN_CALLS', default=10, cast=int)
+CIRCUIT_BREAKER_WINDOW_SECONDS = config('CIRCUIT_BREAKER_WINDOW_SECONDS', default=30.0, cast=float)
+CIRCUIT_BREAKER_OPEN_SECONDS = config('CIRCUIT_BREAKER_OPEN_SECONDS', default=30.0, cast=float)
+
+# On-demand profiling of single requests (see api_v1.middleware.RequestProfilingMiddleware).
+# When enabled, send `X-Profile: sample|cprofile` or `?profile=...` together with
+# `X-Profile-Token: <REQUEST_PROFILING_TOKEN>` to profile a request. Without a token
+# profiling stays off. `sample` (the default) covers all threads; `cprofile` only the
+# request thread, so it misses the searches /transfer/ runs on scheduler threads.
+REQUEST_PROFILING_ENABLED = config('REQUEST_PROFILING_ENABLED', default=False, cast=bool)
+REQUEST_PROFILING_TOKEN = config('REQUEST_PROFILING_TOKEN', default='')
+REQUEST_PROFILING_DIR = config('REQUEST_PROFILING_DIR', default=str(BASE_DIR / 'profiles'))
+REQUEST_PROFILING_SAMPLE_INTERVAL = config('REQUEST_PROFILING_SAMPLE_INTERVAL', default=0.005, cast=float)
+
+# Background transfers are split into work units that `manage.py run_transfer_worker`
+# processes on any node (see api_v1.jobs). A worker holds a unit for LEASE_SECONDS
+# past its last heartbeat; a unit is given up after MAX_ATTEMPTS failed tries.
+TRANSFER_JOB_LEASE_SECONDS = config('TRANSFER_JOB_LEASE_SECONDS', default=60, cast=int)
+TRANSFER_JOB_MAX_ATTEMPTS = config('TRANSFER_JOB_MAX_ATTEMPTS', default=5, cast=int)
+
+# Resolved Spotify track -> YouTube Music video matches shared by all transfers
+# (see api_v1.matching); entries older than TTL_DAYS are searched again (0 = keep forever).
+MATCH_CACHE_TTL_DAYS = config('MATCH_CACHE_TTL_DAYS', default=90, cast=int)
+# Playlists (e.g. charts) that `manage.py warm_match_cache` always warms
+MATCH_CACHE_WARM_PLAYLISTS = config('MATCH_CACHE_WARM_PLAYLISTS', default='', cast=Csv())
+MATCH_CACHE_WARM_SEARCHES_PER_SECOND = config('MATCH_CACHE_WARM_SEARCHES_PER_SECOND', default=2.0, cast=float)
+# Read-only snapshot of the newest MAX_ENTRIES cache entries that every worker process
+# memory-maps and checks before the database (see api_v1.snapshot). Rebuild it with
+# `manage.py build_match_snapshot`; workers look for a new one every CHECK_SECONDS.
+# An empty path disables it.
+MATCH_SNAPSHOT_PATH = config('MATCH_SNAPSHOT_PATH', default=str(BASE_DIR / 'match_snapshot.bin'))
+MATCH_SNAPSHOT_MAX_ENTRIES = config('MATCH_SNAPSHOT_MAX_ENTRIES', default=2000000, cast=int)
+MATCH_SNAPSHOT_CHECK_SECONDS = config('MATCH_SNAPSHOT_CHECK_SECONDS', default=30.0, cast=float)
+# A snapshot older than this is ignored (and reported as stale by /api/v1/metrics/), so
+# workers don't keep serving it forever if the rebuilds stop; 0 = no limit. Set it to
+# about twice the rebuild interval (the default suits a daily rebuild).
+MATCH_SNAPSHOT_MAX_AGE_SECONDS = config('MATCH_SNAPSHOT_MAX_AGE_SECONDS', default=2 * 24 * 3600, cast=float)
+
+# Hedged YouTube Music searches (see api_v1.hedging): a search still running after the
+# PERCENTILE-th percentile of recent search latency (at least MIN_DELAY seconds) is
+# issued a second time and the first answer wins. Hedges are capped at BUDGET (a
+# fraction) of searches. Stats are reported by /api/v1/metrics/.
+SEARCH_HEDGING_ENABLED = config('SEARCH_HEDGING_ENABLED', default=False, cast=bool)
+SEARCH_HEDGE_PERCENTILE = config('SEARCH_HEDGE_PERCENTILE', default=95.0, cast=float)
+SEARCH_HEDGE_BUDGET = config('SEARCH_HEDGE_BUDGET', default=0.05, cast=float)
+SEARCH_HEDGE_MIN_DELAY = config('SEARCH_HEDGE_MIN_DELAY', default=0.05, cast=float)
+SEARCH_HEDGE_MIN_SAMPLES = config('SEARCH_HEDGE_MIN_SAMPLES', default=20, cast=int)
+
+# Every Spotify client in a process shares one keep-alive connection pool (see
+# api_v1.providers.spotify_session); this caps the idle connections it keeps open.
+SPOTIFY_HTTP_POOL_SIZE = config('SPOTIFY_HTTP_POOL_SIZE', default=16, cast=int)
+
+# Admission control for /transfer/ (see api_v1.admission); 0 disables a limit. Requests
+# over a limit get 429 (per user) or 503 with Retry-After. Current values are shown
+# by /api/v1/metrics/.
+# - tracks of synchronous transfers running at once in one process
+TRANSFER_ADMISSION_MAX_INFLIGHT_TRACKS = config('TRANSFER_ADMISSION_MAX_INFLIGHT_TRACKS', default=1000, cast=int)
+# - tracks waiting to be fetched/searched by background workers, all nodes together
+TRANSFER_ADMISSION_MAX_BACKGROUND_TRACKS = config('TRANSFER_ADMISSION_MAX_BACKGROUND_TRACKS', default=50000, cast=int)
+# - transfers one Spotify user may have running at once
+TRANSFER_ADMISSION_MAX_PER_USER = config('TRANSFER_ADMISSION_MAX_PER_USER', default=2, cast=int)
+TRANSFER_ADMISSION_RETRY_AFTER = config('TRANSFER_ADMISSION_RETRY_AFTER', default=30, cast=int)
+# Calls per minute one process may make to each provider; a synchronous transfer is only
+# admitted if the remaining YouTube Music budget covers its searches
+PROVIDER_QUOTA_SPOTIFY_CALLS_PER_MINUTE = config('PROVIDER_QUOTA_SPOTIFY_CALLS_PER_MINUTE', default=0, cast=int)
+PROVIDER_QUOTA_YTMUSIC_CALLS_PER_MINUTE = config('PROVIDER_QUOTA_YTMUSIC_CALLS_PER_MINUTE', default=0, cast=int)
+
+# Time budgets for a transfer (see api_v1.deadlines); 0 = no limit. Every Spotify /
+# YouTube Music request gets the remaining budget as its timeout at most. A synchronous
+# transfer stops searching WRITE_RESERVE_SECONDS before its deadline, adds what it found
+# to the playlist and is paused so it can be resumed. A background transfer that runs
+# past BACKGROUND_DEADLINE_SECONDS (counted from its creation) skips its remaining
+# searches and is finished as "partial" with the tracks matched so far. Keep
+# TRANSFER_DEADLINE_SECONDS below the web server's worker timeout.
+TRANSFER_DEADLINE_SECONDS = config('TRANSFER_DEADLINE_SECONDS', default=55.0, cast=float)
+TRANSFER_DEADLINE_WRITE_RESERVE_SECONDS = config('TRANSFER_DEADLINE_WRITE_RESERVE_SECONDS', default=10.0, cast=float)
+TRANSFER_BACKGROUND_DEADLINE_SECONDS = config('TRANSFER_BACKGROUND_DEADLINE_SECONDS', default=6 * 3600, cast=float)
+
+# Per-track transfer reports (GET /api/v1/transfers/<id>/report/, see api_v1.reports) are
+# paged with a cursor; tracks per page when the client doesn't pass ?limit=, and at most.
+TRANSFER_REPORT_PAGE_SIZE = config('TRANSFER_REPORT_PAGE_SIZE', default=1000, cast=int)
+TRANSFER_REPORT_MAX_PAGE_SIZE = config('TRANSFER_REPORT_MAX_PAGE_SIZE', default=10000, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators